@@ -1,22 +1,43 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, jsonify, g,
+                   abort, send_file, Response)
 import os
-from werkzeug.utils import secure_filename
-from werkzeug.security import check_password_hash, generate_password_hash
-from openpyxl import Workbook, load_workbook
-from datetime import datetime
+import re
+import cProfile
+import io
+import logging
+import pstats
+import time
+import base64
+import functools
+import json
+import tempfile
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
+from datetime import datetime, timedelta
 import uuid
+import click
 from dotenv import load_dotenv
 
-import cv2
-from skimage.metrics import structural_similarity as ssim
-from PIL import Image
-import imagehash
-import numpy as np
+import metrics
+from cleanup import CleanupQueue
+from duplicates import DuplicateIndex
+from export import iter_csv, iter_file, write_xlsx
+from locks import per_process_thread
+from pagecache import PageCache
+from scoring import ScoringQueue, score_many
+from thumbnails import ThumbnailCache
+from uploads import UploadRequest, forget_upload, format_size, store_upload, stored_at
+# similarity (OpenCV, scikit-image, numpy) is imported where it is used: it is the bulk of
+# the startup cost, and under preload_app warm_up() loads it once in the gunicorn master.
+from storage import AUTO_APPROVED_PREFIX, ExcelStorage, SQLiteStorage, create_storage, import_excel
 
 # Load environment variables FIRST
 load_dotenv()
 
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # SECURE: Always provide fallbacks for environment variables
 app.secret_key = os.environ.get('SECRET_KEY') or 'dev-fallback-key-change-in-production-NEVER-USE-THIS'
@@ -26,215 +47,276 @@ app.secret_key = os.environ.get('SECRET_KEY') or 'dev-fallback-key-change-in-pro
 UPLOAD_FOLDER_TASKS       = os.environ.get('UPLOAD_FOLDER_TASKS', 'static/uploads/tasks')
 UPLOAD_FOLDER_SUBMISSIONS = os.environ.get('UPLOAD_FOLDER_SUBMISSIONS', 'static/uploads/submissions')
 ALLOWED_EXTENSIONS        = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-MAX_FILE_SIZE             = int(os.environ.get('MAX_FILE_SIZE', 5242880))  # 5MB default
+MAX_FILE_SIZE             = int(os.environ.get('MAX_FILE_SIZE', 5242880))  # 5MB default, per image
+# Whole request body: three proof images plus the form fields
+MAX_CONTENT_LENGTH        = int(os.environ.get('MAX_CONTENT_LENGTH', 3 * MAX_FILE_SIZE + 65536))
+# Uploads are spooled here while they stream in, then renamed into the upload folders
+UPLOAD_STAGING_DIR        = os.environ.get('UPLOAD_STAGING_DIR', 'data/upload-staging')
+# WebP previews shown in image lists; originals load only when opened
+THUMBNAIL_CACHE_DIR       = os.environ.get('THUMBNAIL_CACHE_DIR', 'data/thumbnails')
+THUMBNAIL_SIZE            = int(os.environ.get('THUMBNAIL_SIZE', 320))  # px, longest side
+THUMBNAIL_CACHE_BYTES     = int(os.environ.get('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024))
+# Uploads used this recently are never removed by cleanup (a row may be about to reference them)
+UPLOAD_CLEANUP_GRACE      = int(os.environ.get('UPLOAD_CLEANUP_GRACE', 300))  # seconds
+SCORING_WORKERS           = int(os.environ.get('SCORING_WORKERS', 2))  # 0 = score inside the request
+# Jobs still queued after this long were lost with their worker; each worker resubmits them on start
+SCORING_REQUEUE_AFTER     = int(os.environ.get('SCORING_REQUEUE_AFTER', 600))  # seconds, 0 = never
 
 # SECURE: Database paths from environment with fallbacks
 TASKS_DB_PATH             = os.environ.get('TASKS_DB_PATH', 'data/tasks.xlsx')
 SUBMISSIONS_DB_PATH       = os.environ.get('SUBMISSIONS_DB_PATH', 'data/submissions.xlsx')
+SQLITE_DB_PATH            = os.environ.get('SQLITE_DB_PATH', 'data/microtasks.db')
+STORAGE_BACKEND           = os.environ.get('STORAGE_BACKEND', 'excel').lower()  # 'excel' or 'sqlite'
+# Excel backend: submission writes are journaled here and folded into the workbook periodically
+SUBMISSIONS_JOURNAL_PATH  = os.environ.get('SUBMISSIONS_JOURNAL_PATH', 'data/submissions.journal.jsonl')
+JOURNAL_COMPACT_INTERVAL  = int(os.environ.get('JOURNAL_COMPACT_INTERVAL', 30))  # seconds
+# Excel backend: dashboard counters, kept up to date by every write (SQLite keeps them in a table)
+STATS_PATH                = os.environ.get('STATS_PATH', 'data/stats.json')
+# Perceptual hashes of every proof, for flagging re-used screenshots
+DUPLICATE_INDEX_PATH      = os.environ.get('DUPLICATE_INDEX_PATH', 'data/proof_hashes.jsonl')
+DUPLICATE_MAX_DISTANCE    = int(os.environ.get('DUPLICATE_MAX_DISTANCE', 6))  # differing bits of 64
+# Observability: per-worker metric snapshots merged by /admin/metrics, and request profiling
+METRICS_DIR               = os.environ.get('METRICS_DIR', 'data/metrics')
+METRICS_TOKEN             = os.environ.get('METRICS_TOKEN', '')  # lets a scraper use a bearer token
+PROFILE_REQUESTS          = os.environ.get('PROFILE_REQUESTS', 'False').lower() == 'true'
+PROFILE_DIR               = os.environ.get('PROFILE_DIR', 'data/profiles')
+SUBMISSIONS_PAGE_SIZE     = int(os.environ.get('SUBMISSIONS_PAGE_SIZE', 50))  # rows per admin listing page
+DASHBOARD_TOP_TASKS       = int(os.environ.get('DASHBOARD_TOP_TASKS', 10))  # per-task rows on the dashboard
+PAGE_CACHE_SIZE           = int(os.environ.get('PAGE_CACHE_SIZE', 256))  # rendered public pages per worker; 0 = off
+
+app.config.update(MAX_FILE_SIZE=MAX_FILE_SIZE, MAX_CONTENT_LENGTH=MAX_CONTENT_LENGTH,
+                  UPLOAD_STAGING_DIR=UPLOAD_STAGING_DIR)
 
 # Create directories on first run
 os.makedirs(UPLOAD_FOLDER_TASKS, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER_SUBMISSIONS, exist_ok=True)
+os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
 # Create database directory from path
 os.makedirs(os.path.dirname(TASKS_DB_PATH), exist_ok=True)
+if STORAGE_BACKEND == 'sqlite':
+    os.makedirs(os.path.dirname(SQLITE_DB_PATH) or '.', exist_ok=True)
+os.makedirs(os.path.dirname(DUPLICATE_INDEX_PATH) or '.', exist_ok=True)
 
 # SECURE: Admin credentials with fallbacks
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
-ADMIN_PASSWORD_HASH = generate_password_hash(ADMIN_PASSWORD)
+
+@functools.lru_cache(maxsize=None)
+def admin_password_hash():
+    """Hashed on first login rather than at import (a deliberately slow hash)."""
+    return generate_password_hash(ADMIN_PASSWORD)
 
 # ─────────────────────────── Helper functions ────────────────────────
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def init_excel_files():
-    """Create blank Excel files on first run."""
-    if not os.path.exists(TASKS_DB_PATH):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Tasks'
-        ws.append(['id', 'title', 'description', 'reference_image',
-                   'created_at', 'status'])
-        wb.save(TASKS_DB_PATH)
-
-    if not os.path.exists(SUBMISSIONS_DB_PATH):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Submissions'
-        # Added mobile_number and bank details columns
-        ws.append(['id', 'task_id', 'user_name', 'user_email', 'mobile_number',
-                   'proof_image', 'submitted_at', 'status', 'admin_notes',
-                   'account_holder_name', 'bank_account_number', 'bank_name',
-                   'ifsc_code', 'branch_name', 'confirmation_mobile'])
-        wb.save(SUBMISSIONS_DB_PATH)
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_SIZE, budget_bytes=THUMBNAIL_CACHE_BYTES)
+THUMBNAIL_SOURCES = {'tasks': UPLOAD_FOLDER_TASKS, 'submissions': UPLOAD_FOLDER_SUBMISSIONS}
+
+metrics.configure(METRICS_DIR)
+
+storage = create_storage(STORAGE_BACKEND, TASKS_DB_PATH, SUBMISSIONS_DB_PATH, SQLITE_DB_PATH,
+                         SUBMISSIONS_JOURNAL_PATH or None, JOURNAL_COMPACT_INTERVAL, STATS_PATH or None)
+
+def legacy_excel_storage():
+    """The workbooks (and journal) as an ExcelStorage, regardless of STORAGE_BACKEND."""
+    return ExcelStorage(TASKS_DB_PATH, SUBMISSIONS_DB_PATH, SUBMISSIONS_JOURNAL_PATH or None, 0)
+
+def init_storage(repair=True):
+    """
+    Create blank storage on first run; a new SQLite database imports the
+    workbooks once. Rows an old version wrote into the wrong columns are
+    put back (see swapped_status_repairs()).
+    """
+    created = storage.init()
+    if created and isinstance(storage, SQLiteStorage):
+        tasks, submissions = import_excel(storage, legacy_excel_storage())
+        if tasks or submissions:
+            app.logger.info('Imported %d tasks and %d submissions into %s', tasks, submissions, SQLITE_DB_PATH)
+    repaired = repair_swapped_statuses() if repair else None
+    if repaired:
+        app.logger.warning('Repaired %d submissions whose status was stored as their date', len(repaired))
+
+SUBMISSION_STATUSES = ('pending', 'approved', 'rejected')
+# Proof names before content addressing: <task>_<YYYYmmdd_HHMMSSffffff>_<n>_<name>
+LEGACY_PROOF_TIME = re.compile(r'_(\d{8}_\d{6})\d*_\d+_')
+
+def legacy_upload_time(submission):
+    """When a proof was uploaded, from its old-style filename or else the file's mtime ('' if neither)."""
+    for name in proof_files(submission):
+        match = LEGACY_PROOF_TIME.search(name)
+        if match:
+            return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            mtime = os.path.getmtime(os.path.join(UPLOAD_FOLDER_SUBMISSIONS, name))
+        except OSError:
+            continue
+        return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    return ''
+
+def swapped_status_repairs():
+    """
+    Rows the original update_submission_status() wrote by column position:
+    the status went into submitted_at and the notes into status. Returns
+    {id: fields that put them back}; the overwritten upload time is
+    recovered with legacy_upload_time().
+    """
+    repairs, after = {}, None
+    while True:
+        # Status words sort after every timestamp, so only those rows are read
+        page, after = storage.query_submissions(descending=False, limit=500, after=after, submitted_from='a')
+        for s in page:
+            if s.get('submitted_at') not in SUBMISSION_STATUSES:
+                continue
+            fields = {'submitted_at': legacy_upload_time(s)}
+            if s.get('status') not in SUBMISSION_STATUSES:  # still holds the notes
+                fields.update(status=s['submitted_at'], admin_notes=s.get('admin_notes') or s.get('status') or '')
+            repairs[s['id']] = fields
+        if after is None:
+            return repairs
+
+def repair_swapped_statuses(dry_run=False):
+    """Put swapped rows back (see swapped_status_repairs()); returns {id: fields written}."""
+    repairs = swapped_status_repairs()
+    if repairs and not dry_run:
+        with storage.transaction(('submissions',)) as tx:
+            for submission_id, fields in repairs.items():
+                current = tx.get_submission(submission_id)
+                if current and current.get('submitted_at') in SUBMISSION_STATUSES:
+                    tx.update_submission(submission_id, fields)
+    return repairs
+
+_storage_ready = False
+
+def ensure_storage():
+    """init_storage() once per process, on first use instead of at import."""
+    global _storage_ready
+    if not _storage_ready:
+        init_storage()
+        _storage_ready = True
+
+def warm_up():
+    """
+    Do the first-use work up front: storage, the admin password hash and
+    the similarity engine. gunicorn.conf.py calls this in the master under
+    preload_app, so forked workers share the loaded pages.
+    """
+    start = time.perf_counter()
+    ensure_storage()
+    storage.close()  # connections must not cross fork()
+    admin_password_hash()
+    import similarity  # noqa: F401
+    app.logger.info('Warmed up in %.2fs', time.perf_counter() - start)
 
 
 def get_tasks():
     try:
-        wb = load_workbook(TASKS_DB_PATH)
-        ws = wb.active
-        headers = [cell.value for cell in ws[1]]
-        return [dict(zip(headers, row))
-                for row in ws.iter_rows(min_row=2, values_only=True) if row[0]]
+        return storage.get_tasks()
     except Exception as e:
-        print('Error loading tasks:', e)
+        app.logger.error('Error loading tasks: %s', e)
+        g.page_uncacheable = True  # a stand-in result must not be cached (see cached_page)
         return []
 
 def get_task_by_id(task_id):
-    return next((t for t in get_tasks() if str(t['id']) == str(task_id)), None)
+    try:
+        return storage.get_task(task_id)
+    except Exception as e:
+        app.logger.error('Error loading task: %s', e)
+        g.page_uncacheable = True
+        return None
 
 def add_task(title, description, reference_image):
     try:
-        wb = load_workbook(TASKS_DB_PATH)
-        ws = wb.active
         task_id = str(uuid.uuid4())[:8]
-        ws.append([task_id, title, description, reference_image,
-                   datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'active'])
-        wb.save(TASKS_DB_PATH)
+        storage.add_task({'id': task_id, 'title': title, 'description': description,
+                          'reference_image': reference_image,
+                          'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                          'status': 'active'})
         return task_id
     except Exception as e:
-        print('Error adding task:', e)
+        app.logger.error('Error adding task: %s', e)
         return None
 
-def add_submission(task_id, user_name, user_email, mobile_number, proof_images, bank_details=None):
+def add_submission(task_id, user_name, user_email, mobile_number, proof_images, bank_details=None,
+                   scoring_status=''):
     """Add submission with mobile number, multiple proof images (1-3 images), and bank details"""
     try:
-        wb = load_workbook(SUBMISSIONS_DB_PATH)
-        ws = wb.active
         submission_id = str(uuid.uuid4())[:8]
         images_csv = ','.join(proof_images) if isinstance(proof_images, list) else proof_images
         
         # Bank details (default to empty strings if not provided)
         if bank_details is None:
             bank_details = {}
-        account_holder_name = bank_details.get('account_holder_name', '')
-        bank_account_number = bank_details.get('bank_account_number', '')
-        bank_name = bank_details.get('bank_name', '')
-        ifsc_code = bank_details.get('ifsc_code', '')
-        branch_name = bank_details.get('branch_name', '')
-        confirmation_mobile = bank_details.get('confirmation_mobile', '')
         
         # Ensure status is always 'pending' (never None)
-        ws.append([submission_id, task_id, user_name, user_email, mobile_number, images_csv,
-                  datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'pending', '',
-                  account_holder_name, bank_account_number, bank_name,
-                  ifsc_code, branch_name, confirmation_mobile])
-        wb.save(SUBMISSIONS_DB_PATH)
+        storage.add_submission({
+            'id': submission_id, 'task_id': task_id, 'user_name': user_name,
+            'user_email': user_email, 'mobile_number': mobile_number,
+            'proof_image': images_csv,
+            'submitted_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': 'pending', 'admin_notes': '',
+            'account_holder_name': bank_details.get('account_holder_name', ''),
+            'bank_account_number': bank_details.get('bank_account_number', ''),
+            'bank_name': bank_details.get('bank_name', ''),
+            'ifsc_code': bank_details.get('ifsc_code', ''),
+            'branch_name': bank_details.get('branch_name', ''),
+            'confirmation_mobile': bank_details.get('confirmation_mobile', ''),
+            'similarity_score': '', 'image_scores': '',
+            'scoring_status': scoring_status, 'scoring_stages': '', 'duplicate_of': '',
+        })
         return submission_id
     except Exception as e:
-        print('Error adding submission:', e)
+        app.logger.error('Error adding submission: %s', e)
         return None
 
 
 
 def get_submissions():
     try:
-        wb = load_workbook(SUBMISSIONS_DB_PATH)
-        ws = wb.active
-        headers = [cell.value for cell in ws[1]]
-        return [dict(zip(headers, row))
-                for row in ws.iter_rows(min_row=2, values_only=True) if row[0]]
+        return storage.get_submissions()
     except Exception as e:
-        print('Error loading submissions:', e)
+        app.logger.error('Error loading submissions: %s', e)
         return []
     
-def preprocess_image_for_comparison(image_path, output_size=(512, 512)):
-    """
-    Preprocess images to improve comparison accuracy
-    """
-    try:
-        img = cv2.imread(image_path)
-        
-        # 1. Resize to standard size
-        img = cv2.resize(img, output_size)
-        
-        # 2. Noise reduction
-        img = cv2.bilateralFilter(img, 9, 75, 75)
-        
-        # 3. Enhance contrast
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        lab[:,:,0] = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8)).apply(lab[:,:,0])
-        img = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
-        
-        # Save processed image temporarily
-        temp_path = image_path.replace('.', '_processed.')
-        cv2.imwrite(temp_path, img)
-        
-        return temp_path
-        
-    except Exception as e:
-        print(f"Preprocessing error: {e}")
-        return image_path  # Return original if processing fails
+# Admin listing sort options: name -> (query_submissions sort, descending)
+SUBMISSION_SORTS = {
+    'newest': ('submitted_at', True), 'oldest': ('submitted_at', False),
+    'score_desc': ('similarity', True), 'score_asc': ('similarity', False),
+}
+SUBMISSION_FILTERS = ('status', 'task_id', 'date_from', 'date_to', 'min_score', 'max_score', 'sort')
 
-    
-def calculate_similarity_score(admin_image_path, user_image_path):
-    """
-    Enhanced similarity calculation with multiple methods for higher accuracy
-    Returns score between 0.0 and 1.0 (higher = more similar)
-    """
-    try:
-        # Load images
-        img1 = cv2.imread(admin_image_path)
-        img2 = cv2.imread(user_image_path)
-        
-        if img1 is None or img2 is None:
-            return 0.0
-        
-        # Resize to same dimensions for comparison
-        height, width = img1.shape[:2]
-        img2 = cv2.resize(img2, (width, height))
-        
-        scores = []
-        
-        # Method 1: SSIM with multiple color channels
-        gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-        ssim_score = ssim(gray1, gray2)
-        scores.append(('ssim', ssim_score, 0.3))  # 30% weight
-        
-        # Method 2: Histogram comparison (color distribution)
-        hist1 = cv2.calcHist([img1], [0, 1, 2], None, [50, 50, 50], [0, 256, 0, 256, 0, 256])
-        hist2 = cv2.calcHist([img2], [0, 1, 2], None, [50, 50, 50], [0, 256, 0, 256, 0, 256])
-        hist_corr = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
-        scores.append(('histogram', hist_corr, 0.25))  # 25% weight
-        
-        # Method 3: Enhanced perceptual hash
-        hash1 = imagehash.average_hash(Image.open(admin_image_path), hash_size=16)
-        hash2 = imagehash.average_hash(Image.open(user_image_path), hash_size=16)
-        hash_diff = hash1 - hash2
-        hash_similarity = max(0, (64 - hash_diff) / 64)  # 64 bits for 16x16 hash
-        scores.append(('hash', hash_similarity, 0.2))  # 20% weight
-        
-        # Method 4: Feature matching with ORB
-        orb = cv2.ORB_create(nfeatures=500)
-        kp1, des1 = orb.detectAndCompute(gray1, None)
-        kp2, des2 = orb.detectAndCompute(gray2, None)
-        
-        if des1 is not None and des2 is not None:
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            matches = bf.match(des1, des2)
-            matches = sorted(matches, key=lambda x: x.distance)
-            
-            # Calculate feature similarity based on good matches
-            good_matches = [m for m in matches if m.distance < 50]
-            feature_similarity = min(len(good_matches) / 20, 1.0)  # Normalize to 0-1
-        else:
-            feature_similarity = 0.0
-        
-        scores.append(('features', feature_similarity, 0.25))  # 25% weight
-        
-        # Calculate weighted final score
-        final_score = sum(score * weight for _, score, weight in scores)
-        
-        # Debug output (remove in production)
-        print(f"Similarity breakdown: SSIM={ssim_score:.3f}, Hist={hist_corr:.3f}, Hash={hash_similarity:.3f}, Features={feature_similarity:.3f}, Final={final_score:.3f}")
-        
-        return max(0.0, min(1.0, final_score))
-        
-    except Exception as e:
-        print(f"Similarity calculation error: {e}")
-        return 0.0
+def submission_query(args):
+    """query_submissions() arguments for the listing's filter parameters; bad values are ignored."""
+    sort, descending = SUBMISSION_SORTS.get(args.get('sort'), SUBMISSION_SORTS['newest'])
+    query = {'sort': sort, 'descending': descending,
+             'status': args.get('status') or None, 'task_id': args.get('task_id') or None}
+    for name, key, shift in (('date_from', 'submitted_from', 0), ('date_to', 'submitted_before', 1)):
+        try:
+            day = datetime.strptime(args.get(name, ''), '%Y-%m-%d') + timedelta(days=shift)
+            query[key] = day.strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    for name in ('min_score', 'max_score'):  # percent in the form, 0-1 in storage
+        try:
+            query[name] = float(args[name]) / 100
+        except (KeyError, ValueError):
+            pass
+    return query
 
+def encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+def decode_cursor(value):
+    """query_submissions() `after` from a request parameter; ValueError if it is malformed."""
+    if not value:
+        return None
+    try:
+        after = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Bad cursor: {e}') from e
+    if not isinstance(after, list):
+        raise ValueError('Bad cursor')
+    return after
 
 # Set your similarity threshold
 SIMILARITY_THRESHOLD = 0.50  # 50% similarity for auto-approval
@@ -242,82 +324,319 @@ SIMILARITY_THRESHOLD = 0.50  # 50% similarity for auto-approval
 def update_submission_status(submission_id, status, notes=''):
     """Update submission row and return its task_id."""
     try:
-        wb = load_workbook(SUBMISSIONS_DB_PATH)
-        ws = wb.active
-        task_id = None
-        for row in range(2, ws.max_row + 1):
-            if str(ws.cell(row=row, column=1).value) == str(submission_id):
-                task_id = ws.cell(row=row, column=2).value
-                ws.cell(row=row, column=7, value=status)
-                ws.cell(row=row, column=8, value=notes)
-                break
-        wb.save(SUBMISSIONS_DB_PATH)
-        return task_id
+        row = storage.update_submission(submission_id, {'status': status, 'admin_notes': notes})
+        return row['task_id'] if row else None
     except Exception as e:
-        print('Error updating submission:', e)
+        app.logger.error('Error updating submission: %s', e)
+        return None
+
+duplicate_index = DuplicateIndex(DUPLICATE_INDEX_PATH)
+
+def flag_duplicates(submission_id, images):
+    """Index a submission's proof hashes; return ids of earlier submissions that match."""
+    submission = storage.get_submission(submission_id)
+    if not submission:
+        return []
+    filenames = proof_files(submission)
+    hashes = [(image['phash'], name) for image, name in zip(images, filenames) if image.get('phash')]
+    if not hashes:
+        return []
+    duplicate_ids = []
+    for _, other_id, _ in duplicate_index.check_and_add(submission_id, hashes, DUPLICATE_MAX_DISTANCE):
+        # The index keeps entries of deleted submissions until it is rebuilt
+        if other_id not in duplicate_ids and storage.get_submission(other_id):
+            duplicate_ids.append(other_id)
+    return duplicate_ids
+
+# A cascaded score that stopped early is only a bound, stored with its side
+# ('<=0.3012', '>=0.5500') and never as a similarity_score
+BOUND_OPS = {'lower': '>=', 'upper': '<='}
+BOUND_SIGNS = {'>=': '≥ ', '<=': '≤ '}
+
+def score_text(score, bound=None):
+    """A score as stored in image_scores / similarity_bound."""
+    return f'{BOUND_OPS.get(bound, "")}{score:.4f}'
+
+def parse_score(text):
+    """(value, op) of a stored score, op '' for an exact one; None if empty."""
+    text = '' if text is None else str(text).strip()
+    if not text:
         return None
+    op = text[:2] if text[:2] in BOUND_SIGNS else ''
+    return float(text[len(op):]), op
+
+def score_label(text, digits=0):
+    """'30%', or '≤ 30%' for a bound."""
+    parsed = parse_score(text)
+    if parsed is None:
+        return ''
+    value, op = parsed
+    return f'{BOUND_SIGNS.get(op, "")}{value * 100:.{digits}f}%'
+
+@app.template_filter('similarity_label')
+def similarity_label(submission, digits=0):
+    """The submission's exact score, else its cascade bound, as a percentage."""
+    score = submission.get('similarity_score')
+    return score_label(score if score not in (None, '') else submission.get('similarity_bound'), digits)
+
+def stored_score(submission):
+    """The stored score or bound in one comparable form ('0.3012', '<=0.3012'), or None."""
+    score = submission.get('similarity_score')
+    if score not in (None, ''):
+        return score_text(float(score))
+    return submission.get('similarity_bound') or None
+
+def passes_threshold(result, threshold):
+    return result['bound'] == 'lower' or (result['bound'] is None and result['score'] >= threshold)
+
+def similarity_fields(result):
+    """Submission columns for a score_submission() result."""
+    images = result['images']
+    exact = result['bound'] is None
+    # Per-image values follow the proof_image order
+    return {
+        'similarity_score': round(result['score'], 4) if exact else '',
+        'similarity_bound': '' if exact else score_text(result['score'], result['bound']),
+        'image_scores': ','.join(score_text(image['score'], image['bound']) for image in images),
+        'scoring_status': 'done',
+        'scoring_stages': ';'.join(','.join(image['stages']) for image in images),
+    }
+
+def record_similarity(submission_id, result, error=None):
+    """Scoring-job callback: flag re-used proofs, store the score and auto-approve if it passes."""
+    if error is not None:
+        app.logger.error('Similarity calculation error for %s: %s', submission_id, error)
+        storage.update_submission(submission_id, {'scoring_status': 'failed'})
+        return
+    try:
+        duplicates = flag_duplicates(submission_id, result['images'])
+    except Exception as e:
+        app.logger.error('Error checking for duplicate proofs: %s', e)
+        duplicates = []
+    fields = {'duplicate_of': ','.join(duplicates)} if duplicates else {}
+    similarity = result['score']
+    if similarity is None:  # task has no reference image; only the duplicate check ran
+        if fields:
+            storage.update_submission(submission_id, fields)
+        return
+    with storage.transaction(('submissions',)) as tx:
+        submission = tx.update_submission(submission_id, dict(fields, **similarity_fields(result)))
+        # Never overrule a decision an admin made while the job was running,
+        # and leave re-used proofs for manual review
+        if (submission and submission['status'] == 'pending' and not duplicates
+                and passes_threshold(result, SIMILARITY_THRESHOLD)):
+            label = score_label(score_text(similarity, result['bound']), 1)
+            update_submission_status(submission_id, 'approved',
+                                     f'{AUTO_APPROVED_PREFIX}: {label} similarity match')
+
+scoring_queue = ScoringQueue(SCORING_WORKERS, record_similarity, SIMILARITY_THRESHOLD)
+
+def requeue_stale_scoring(older_than=None):
+    """
+    Resubmit scoring jobs that a worker lost when it stopped (jobs live only in
+    its memory). Each row is claimed in a transaction, 'queued' -> 'requeued',
+    so workers starting together resubmit it once; a row lost again stays
+    'requeued' for `flask rescore --queued`.
+    """
+    older_than = SCORING_REQUEUE_AFTER if older_than is None else older_than
+    cutoff = (datetime.now() - timedelta(seconds=older_than)).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        stale = [s['id'] for s in storage.get_submissions()
+                 if s.get('scoring_status') == 'queued' and str(s.get('submitted_at') or '') < cutoff]
+        if not stale:
+            return 0
+        references = {t['id']: t.get('reference_image') for t in storage.get_tasks()}
+        claimed = []
+        with storage.transaction(('submissions',)) as tx:
+            for submission_id in stale:
+                current = tx.get_submission(submission_id)
+                if current and current.get('scoring_status') == 'queued':
+                    reference = references.get(current['task_id'])
+                    tx.update_submission(submission_id, {'scoring_status': 'requeued' if reference else ''})
+                    claimed.append((current, reference))
+    except Exception as e:
+        app.logger.error('Error requeuing scoring jobs: %s', e)
+        return 0
+    for submission, reference in claimed:
+        scoring_queue.submit(submission['id'],
+                             os.path.join(UPLOAD_FOLDER_TASKS, reference) if reference else None,
+                             [os.path.join(UPLOAD_FOLDER_SUBMISSIONS, p) for p in proof_files(submission)])
+    if claimed:
+        app.logger.warning('Requeued %d scoring jobs lost by a stopped worker', len(claimed))
+    return len(claimed)
+
+_ensure_requeue = per_process_thread('scoring-requeue', requeue_stale_scoring)
 
 def update_task_status(task_id, new_status):
     try:
-        wb = load_workbook(TASKS_DB_PATH)
-        ws = wb.active
-        for row in range(2, ws.max_row + 1):
-            if str(ws.cell(row=row, column=1).value) == str(task_id):
-                ws.cell(row=row, column=6, value=new_status)
-                break
-        wb.save(TASKS_DB_PATH)
+        storage.update_task(task_id, {'status': new_status})
         return True
     except Exception as e:
-        print('Error updating task status:', e)
+        app.logger.error('Error updating task status: %s', e)
         return False
 
 def count_completed_tasks():
     try:
-        wb = load_workbook(TASKS_DB_PATH)
-        ws = wb.active
-        return sum(1 for row in ws.iter_rows(min_row=2, values_only=True)
-                   if row and row[5] == 'completed')
+        return storage.count_tasks('completed')
     except Exception as e:
-        print('Error counting completed tasks:', e)
+        app.logger.error('Error counting completed tasks: %s', e)
+        g.page_uncacheable = True
         return 0
 
+def task_stats(counters, limit=DASHBOARD_TOP_TASKS):
+    """Per-task counts and approval rates for the tasks with the most submissions."""
+    totals = sorted(((value, key.split(':')[1]) for key, value in counters.items()
+                     if key.startswith('task:') and key.endswith(':submissions')), reverse=True)
+    rows = []
+    for submissions, task_id in totals[:limit]:
+        row = {name: counters.get(f'task:{task_id}:{name}', 0)
+               for name in ('pending', 'approved', 'rejected', 'auto_approved')}
+        decided = row['approved'] + row['rejected']
+        task = get_task_by_id(task_id)
+        row.update(id=task_id, title=task['title'] if task else 'Deleted task', submissions=submissions,
+                   approval_rate=row['approved'] / decided if decided else None)
+        rows.append(row)
+    return rows
+
+def proof_files(submission):
+    return [p.strip() for p in str(submission.get('proof_image') or '').split(',') if p.strip()]
+
+def remove_upload(kind, name):
+    """Delete an uploaded file with everything derived from it."""
+    path = os.path.join(THUMBNAIL_SOURCES[kind], name)
+    thumbnail_cache.discard(path)
+    from similarity import reference_features_path
+
+    for f in (path, reference_features_path(path)) if kind == 'tasks' else (path,):
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+    forget_upload(path, UPLOAD_STAGING_DIR)
+
+def unreferenced_uploads(kind, names):
+    """
+    The given upload files that no remaining task ('tasks') or submission
+    ('submissions') uses. Uploads are stored by content, so one file can
+    belong to several rows; files used within UPLOAD_CLEANUP_GRACE are kept
+    for a row that may be on its way.
+    """
+    names = set(names)
+    if not names:
+        return []
+    if kind == 'tasks':
+        in_use = {t.get('reference_image') for t in storage.get_tasks()}
+    else:
+        in_use = {p for s in storage.get_submissions() for p in proof_files(s)}
+    cutoff = time.time() - UPLOAD_CLEANUP_GRACE
+    unused = []
+    for name in sorted(names - in_use):
+        try:
+            if stored_at(os.path.join(THUMBNAIL_SOURCES[kind], name), UPLOAD_STAGING_DIR) <= cutoff:
+                unused.append(name)
+        except FileNotFoundError:
+            pass
+    return unused
+
+def remove_unreferenced_uploads(reference_images=(), proofs=()):
+    """Delete the listed uploads that nothing uses any more; returns how many were removed."""
+    removed = 0
+    for kind, names in (('tasks', reference_images), ('submissions', proofs)):
+        for name in unreferenced_uploads(kind, names):
+            remove_upload(kind, name)
+            removed += 1
+    return removed
+
+cleanup_queue = CleanupQueue(remove_unreferenced_uploads)
+
 def delete_task_and_children(task_id):
-    """Completely remove a task, its submissions, and all related files."""
-    # remove task row & reference image
-    wb_t = load_workbook(TASKS_DB_PATH)
-    ws_t = wb_t.active
-    for row in range(2, ws_t.max_row + 1):
-        if str(ws_t.cell(row=row, column=1).value) == str(task_id):
-            ref_img = ws_t.cell(row=row, column=4).value
-            ws_t.delete_rows(row, 1)
-            if ref_img:
-                f = os.path.join(UPLOAD_FOLDER_TASKS, ref_img)
-                if os.path.exists(f):
-                    os.remove(f)
-            break
-    wb_t.save(TASKS_DB_PATH)
-
-    # remove submission rows & proof images
-    wb_s = load_workbook(SUBMISSIONS_DB_PATH)
-    ws_s = wb_s.active
-    rows_to_delete = []
-    for row in range(2, ws_s.max_row + 1):
-        if str(ws_s.cell(row=row, column=2).value) == str(task_id):
-            rows_to_delete.append(row)
-            proof = ws_s.cell(row=row, column=5).value
-            if proof:
-                f = os.path.join(UPLOAD_FOLDER_SUBMISSIONS, proof)
-                if os.path.exists(f):
-                    os.remove(f)
-    for row in reversed(rows_to_delete):
-        ws_s.delete_rows(row, 1)
-    wb_s.save(SUBMISSIONS_DB_PATH)
-
-# Initialize Excel storage
-init_excel_files()
+    """
+    Remove a task and its submissions in one transaction; their files are
+    removed by the cleanup queue. Returns the number of submissions removed.
+    """
+    with storage.transaction() as tx:
+        task = tx.delete_task(task_id)
+        submissions = tx.delete_submissions(task_id)
+    cleanup_queue.submit(
+        [task['reference_image']] if task and task.get('reference_image') else [],
+        [p for s in submissions for p in proof_files(s)])
+    return len(submissions)
+
+# ────────────────────────── Instrumentation ──────────────────────────
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    ensure_storage()
+    if SCORING_REQUEUE_AFTER:
+        _ensure_requeue()
+    # X-Profile: 1 profiles a single request for a logged-in admin
+    if PROFILE_REQUESTS or (request.headers.get('X-Profile') and 'admin_logged_in' in session):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S%f')}_{request.endpoint or 'unknown'}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+        app.logger.info('Profile of %s %s (%s):\n%s', request.method, request.path, name, out.getvalue())
+        response.headers['X-Profile-File'] = name
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe('microtasks_http_request_duration_seconds', time.perf_counter() - started,
+                        endpoint=request.endpoint or 'unknown', method=request.method,
+                        status=response.status_code)
+    return response
+
+# ──────────────────────────── Page cache ─────────────────────────────
+page_cache = PageCache(PAGE_CACHE_SIZE)
+
+def cached_page(view):
+    """
+    Serve a public page from page_cache while the tasks are unchanged, with
+    an ETag and Last-Modified so browsers revalidate and get a 304. Requests
+    with a query string or pending flash messages are rendered as usual, and
+    a render that set g.page_uncacheable is sent once but not kept.
+    """
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        if not PAGE_CACHE_SIZE or request.query_string or '_flashes' in session:
+            metrics.inc('microtasks_page_cache_requests_total', outcome='bypass')
+            return view(**kwargs)
+        try:
+            version, changed_at = storage.tasks_version()
+        except Exception as e:
+            app.logger.error('Error reading the tasks version: %s', e)
+            return view(**kwargs)
+        cached = page_cache.get(request.path, version)
+        if cached is None:
+            response = app.make_response(view(**kwargs))
+            # Not-found redirects, and pages rendered around a storage error
+            # (get_tasks() and friends set the flag), are not cached
+            if response.status_code != 200 or '_flashes' in session or g.get('page_uncacheable'):
+                metrics.inc('microtasks_page_cache_requests_total', outcome='bypass')
+                return response
+            cached = page_cache.put(request.path, version, response.get_data())
+            metrics.inc('microtasks_page_cache_requests_total', outcome='miss')
+        else:
+            metrics.inc('microtasks_page_cache_requests_total', outcome='hit')
+        body, etag = cached
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        if changed_at:
+            response.last_modified = changed_at
+        response.cache_control.no_cache = True  # revalidate on every visit
+        return response.make_conditional(request)
+    return wrapper
 
 # ─────────────────────────────── Routes ───────────────────────────────
 @app.route('/')
+@cached_page
 def index():
     tasks = get_tasks()
     active_tasks = [t for t in tasks if t['status'] == 'active']
@@ -327,16 +646,19 @@ def index():
                            completed_tasks=completed_tasks)
 
 @app.route('/task/<task_id>')
+@cached_page
 def task_detail(task_id):
     task = get_task_by_id(task_id)
     if not task:
         flash('Task not found!', 'error')
         return redirect(url_for('index'))
-    return render_template('task_detail.html', task=task)
+    return render_template('task_detail.html', task=task,
+                           submission_id=request.args.get('submission'))
 
 @app.route('/submit/<task_id>', methods=['POST'])
 def submit_task(task_id):
-    if not get_task_by_id(task_id):
+    task = get_task_by_id(task_id)
+    if not task:
         flash('Task not found!', 'error')
         return redirect(url_for('index'))
 
@@ -385,40 +707,83 @@ def submit_task(task_id):
 
     # Save all files if validation passes
     try:
-        for i, file in enumerate(uploaded_files):
-            filename = secure_filename(
-                f"{task_id}_{datetime.now().strftime('%Y%m%d_%H%M%S%f')}_{i+1}_{file.filename}")
-            file.save(os.path.join(UPLOAD_FOLDER_SUBMISSIONS, filename))
-            saved_filenames.append(filename)
+        for file in uploaded_files:
+            # Streamed, size-checked and hashed on arrival; stored once per content
+            saved_filenames.append(store_upload(file, UPLOAD_FOLDER_SUBMISSIONS))
         
-        submission_id = add_submission(task_id, user_name, user_email, mobile_number, saved_filenames, bank_details)
+        has_reference = bool(task['reference_image'])
+        submission_id = add_submission(task_id, user_name, user_email, mobile_number, saved_filenames,
+                                       bank_details, scoring_status='queued' if has_reference else '')
         
-        # NEW: Similarity check for auto-approval
+        # Similarity check for auto-approval and the duplicate-proof check run
+        # in the background; the task page polls submission_status for the result
         if submission_id and saved_filenames:
-            task = get_task_by_id(task_id)
-            if task and task['reference_image']:
-                admin_ref_path = os.path.join(UPLOAD_FOLDER_TASKS, task['reference_image'])
-                user_image_path = os.path.join(UPLOAD_FOLDER_SUBMISSIONS, saved_filenames[0])
-                
-                # Calculate similarity
-                similarity = calculate_similarity_score(admin_ref_path, user_image_path)
-                
-                if similarity >= SIMILARITY_THRESHOLD:
-                    # Auto-approve high similarity submissions
-                    update_submission_status(submission_id, 'approved', 
-                        f'Auto-approved: {similarity:.1%} similarity match')
-                    flash(f'✅ Task auto-approved! Similarity: {similarity:.1%}', 'success')
-                else:
-                    flash(f'📝 Submitted for manual review (Similarity: {similarity:.1%})', 'info')
+            admin_ref_path = os.path.join(UPLOAD_FOLDER_TASKS, task['reference_image']) if has_reference else None
+            user_image_paths = [os.path.join(UPLOAD_FOLDER_SUBMISSIONS, f) for f in saved_filenames]
+            try:
+                scoring_queue.submit(submission_id, admin_ref_path, user_image_paths)
+            except Exception as e:
+                # The submission is stored: leave the job to requeue_stale_scoring()
+                # rather than report a failed upload and invite a duplicate
+                app.logger.error('Could not queue scoring for %s: %s', submission_id, e)
+                if not has_reference:
+                    try:
+                        storage.update_submission(submission_id, {'scoring_status': 'queued'})
+                    except Exception as e:
+                        app.logger.error('Error marking %s for requeue: %s', submission_id, e)
+            if has_reference:
+                flash(f'Your proof has been submitted with {len(saved_filenames)} images! '
+                      'Checking it against the reference image…', 'info')
+                return redirect(url_for('task_detail', task_id=task_id, submission=submission_id))
             else:
                 flash(f'Your proof has been submitted successfully with {len(saved_filenames)} images!', 'success')
         
     except Exception as e:
         flash('Error uploading files. Please try again.', 'error')
-        print('Upload error:', e)
+        app.logger.error('Upload error: %s', e)
 
     return redirect(url_for('index'))
 
+@app.route('/thumbnails/<kind>/<path:filename>')
+def thumbnail(kind, filename):
+    """Cached WebP preview of an uploaded image; previews never change, so cache forever."""
+    folder = THUMBNAIL_SOURCES.get(kind)
+    source = safe_join(folder, filename) if folder else None
+    if not source or not allowed_file(filename):
+        abort(404)
+    try:
+        path, key = thumbnail_cache.get(source)
+    except Exception as e:
+        app.logger.warning('Cannot create thumbnail for %s: %s', source, e)
+        return redirect(url_for('static', filename=f'uploads/{kind}/{filename}'))
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype='image/webp', etag=key, conditional=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/submission/<submission_id>/status')
+def submission_status(submission_id):
+    """Lightweight status for the task page to poll while scoring runs."""
+    try:
+        submission = storage.get_submission(submission_id)
+    except Exception as e:
+        app.logger.error('Error loading submission: %s', e)
+        submission = None
+    if not submission:
+        return jsonify({'error': 'not found'}), 404
+    score = submission.get('similarity_score')
+    images = [parse_score(s) for s in str(submission.get('image_scores') or '').split(',') if s]
+    return jsonify({
+        'status': submission.get('status') or 'pending',
+        'scoring_status': submission.get('scoring_status') or '',
+        # Exact scores only; a cascade bound comes separately, as its label
+        'similarity': float(score) if score not in (None, '') else None,
+        'similarity_label': similarity_label(submission, 1),
+        'image_scores': [value if not op else None for value, op in images],
+    })
+
 
 # --------------------------- Admin auth -------------------------------
 @app.route('/admin')
@@ -429,7 +794,7 @@ def admin_login():
 @app.route('/admin/login', methods=['POST'])
 def admin_login_post():
     if request.form.get('username') == ADMIN_USERNAME and \
-       check_password_hash(ADMIN_PASSWORD_HASH, request.form.get('password', '')):
+       check_password_hash(admin_password_hash(), request.form.get('password', '')):
         session['admin_logged_in'] = True
         flash('Login successful!', 'success')
         return redirect(url_for('admin_dashboard'))
@@ -448,16 +813,24 @@ def admin_dashboard():
     if 'admin_logged_in' not in session:
         return redirect(url_for('admin_login'))
 
-    tasks = get_tasks()
-    submissions = get_submissions()
+    try:
+        counters = storage.stats()
+    except Exception as e:
+        app.logger.error('Error loading dashboard stats: %s', e)
+        counters = {}
     stats = {
-        'total_tasks': len(tasks),
-        'active_tasks': len([t for t in tasks if t['status'] == 'active']),
-        'completed_tasks': count_completed_tasks(),
-        'total_submissions': len(submissions),
-        'pending_submissions': len([s for s in submissions if s['status'] == 'pending'])
+        'total_tasks': counters.get('tasks', 0),
+        'active_tasks': counters.get('tasks:active', 0),
+        'completed_tasks': counters.get('tasks:completed', 0),
+        'total_submissions': counters.get('submissions', 0),
+        'pending_submissions': counters.get('submissions:pending', 0),
+        'approved_submissions': counters.get('submissions:approved', 0),
+        'rejected_submissions': counters.get('submissions:rejected', 0),
+        'auto_approved': counters.get('submissions:auto_approved', 0),
     }
-    return render_template('admin_dashboard.html', stats=stats)
+    stats['auto_approval_rate'] = (stats['auto_approved'] / stats['approved_submissions']
+                                   if stats['approved_submissions'] else None)
+    return render_template('admin_dashboard.html', stats=stats, top_tasks=task_stats(counters))
 
 @app.route('/admin/tasks')
 def admin_tasks():
@@ -482,23 +855,86 @@ def admin_add_task():
         flash('Invalid file type.', 'error')
         return redirect(url_for('admin_tasks'))
 
-    filename = secure_filename(
-        f"ref_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{reference.filename}")
-    reference.save(os.path.join(UPLOAD_FOLDER_TASKS, filename))
+    filename = store_upload(reference, UPLOAD_FOLDER_TASKS)
+    reference_path = os.path.join(UPLOAD_FOLDER_TASKS, filename)
+    try:
+        from similarity import build_reference_features
+
+        # Precompute the reference side of the similarity check once
+        build_reference_features(reference_path)
+    except Exception as e:
+        app.logger.warning('Error precomputing reference features: %s', e)  # rebuilt on first scoring instead
     add_task(title, description, filename)
     flash('Task added.', 'success')
     return redirect(url_for('admin_tasks'))
 
 @app.route('/admin/submissions')
 def admin_submissions():
+    """
+    One page of submissions, filtered and sorted in storage. ?format=json
+    returns the rendered rows and the next page's URL for "Load more".
+    """
+    wants_json = request.args.get('format') == 'json'
     if 'admin_logged_in' not in session:
-        return redirect(url_for('admin_login'))
+        return (jsonify({'error': 'login required'}), 401) if wants_json else redirect(url_for('admin_login'))
 
-    subs = get_submissions()
-    title = {t['id']: t['title'] for t in get_tasks()}
+    query = submission_query(request.args)
+    try:
+        after = decode_cursor(request.args.get('after'))
+    except ValueError:
+        abort(400)
+    try:
+        subs, next_after = storage.query_submissions(limit=SUBMISSIONS_PAGE_SIZE, after=after, **query)
+    except Exception as e:
+        app.logger.error('Error loading submissions: %s', e)
+        subs, next_after = [], None
+    tasks = get_tasks()
+    title = {t['id']: t['title'] for t in tasks}
     for s in subs:
         s['task_title'] = title.get(s['task_id'], 'Unknown Task')
-    return render_template('admin_submissions.html', submissions=subs)
+
+    filters = {name: request.args[name] for name in SUBMISSION_FILTERS if request.args.get(name)}
+    next_url = url_for('admin_submissions', after=encode_cursor(next_after), **filters) if next_after else None
+    if wants_json:
+        return jsonify({'html': render_template('_submission_rows.html', submissions=subs),
+                        'count': len(subs), 'next': next_url})
+
+    # Totals come from the status index; other filters only show what is loaded
+    total = None
+    if not set(filters) - {'status', 'sort'}:
+        try:
+            total = storage.count_submissions(query['status'])
+        except Exception as e:
+            app.logger.error('Error counting submissions: %s', e)
+    return render_template('admin_submissions.html', submissions=subs, tasks=tasks, filters=filters,
+                           sorts=SUBMISSION_SORTS, total=total, next_url=next_url)
+
+@app.route('/admin/export/submissions.<fmt>')
+def admin_export_submissions(fmt):
+    """Stream the submissions matching the listing's filters as CSV or XLSX."""
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('admin_login'))
+    if fmt not in ('csv', 'xlsx'):
+        abort(404)
+
+    query = submission_query(request.args)
+    title = {t['id']: t['title'] for t in get_tasks()}
+    rows = (dict(s, task_title=title.get(s['task_id'], 'Unknown Task'))
+            for s in storage.iter_submissions(**query))
+    filters = {name: request.args[name] for name in SUBMISSION_FILTERS if request.args.get(name)}
+    app.logger.info('Exporting submissions as %s with filters %s', fmt, filters)
+
+    if fmt == 'csv':
+        body, mimetype = iter_csv(rows), 'text/csv'
+    else:
+        # A zip cannot be written incrementally; write-only mode spools the sheet to disk
+        body = iter_file(write_xlsx(rows, tempfile.TemporaryFile(dir=UPLOAD_STAGING_DIR)))
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    filename = f'submissions-{datetime.now():%Y%m%d-%H%M%S}.{fmt}'
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',  # bank details
+    })
 
 @app.route('/admin/update_submission', methods=['POST'])
 def admin_update_submission():
@@ -522,6 +958,51 @@ def admin_update_submission():
     # Task stays visible to users - no call to update_task_status()
     return redirect(url_for('admin_submissions'))
 
+@app.route('/admin/bulk_update_submissions', methods=['POST'])
+def admin_bulk_update_submissions():
+    """Approve or reject every selected submission in one storage transaction."""
+    if 'admin_logged_in' not in session:
+        return redirect(url_for('admin_login'))
+
+    submission_ids = list(dict.fromkeys(request.form.getlist('submission_ids')))
+    status = request.form.get('status')
+    notes = request.form.get('notes', '')
+    # Back to the page the reviewer was on, filters included
+    return_to = request.form.get('return_to', '')
+    if not return_to.startswith(url_for('admin_submissions')):
+        return_to = url_for('admin_submissions')
+
+    if status not in ('approved', 'rejected') or not submission_ids:
+        flash('Select at least one submission and a decision.', 'error')
+        return redirect(return_to)
+    try:
+        # Only rows still pending: a stale page must not overturn another
+        # reviewer's decision or an auto-approval made since it was loaded
+        updated, skipped = storage.update_submissions(submission_ids, {'status': status, 'admin_notes': notes},
+                                                      if_status='pending')
+    except Exception as e:
+        app.logger.error('Error updating submissions: %s', e)
+        flash('Error updating submissions. Please try again.', 'error')
+        return redirect(return_to)
+
+    flash(f'{len(updated)} submission(s) {status}.', 'success')
+    decided = sorted(sid for sid, current in skipped.items() if current)
+    missing = len(skipped) - len(decided)
+    if decided:
+        listed = ', '.join(decided[:10]) + (', ...' if len(decided) > 10 else '')
+        flash(f'{len(decided)} submission(s) were already decided and left unchanged: {listed}.', 'error')
+    if missing:
+        flash(f'{missing} submission(s) no longer exist.', 'error')
+    return redirect(return_to)
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Prometheus text exposition of every worker's metrics."""
+    token_ok = METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if 'admin_logged_in' not in session and not token_ok:
+        return redirect(url_for('admin_login'))
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # --------------- Mark task as completed manually ----------------
 @app.route('/admin/mark_completed/<task_id>', methods=['POST'])
 def admin_mark_completed(task_id):
@@ -541,10 +1022,167 @@ def admin_mark_completed(task_id):
 def admin_delete_task(task_id):
     if 'admin_logged_in' not in session:
         return redirect(url_for('admin_login'))
-    delete_task_and_children(task_id)
-    flash('Task and all related data deleted.', 'success')
+    try:
+        delete_task_and_children(task_id)
+        flash('Task and all related data deleted.', 'success')
+    except Exception as e:
+        app.logger.error('Error deleting task %s: %s', task_id, e)
+        flash('Error deleting task. Please try again.', 'error')
     return redirect(url_for('admin_tasks'))
 
+# ------------------------------ CLI -----------------------------------
+@app.cli.command('import-excel')
+def import_excel_command():
+    """Import TASKS_DB_PATH / SUBMISSIONS_DB_PATH into the SQLite database."""
+    db = SQLiteStorage(SQLITE_DB_PATH)
+    db.init()
+    tasks, submissions = import_excel(db, legacy_excel_storage())
+    click.echo(f'Imported {tasks} tasks and {submissions} submissions into {SQLITE_DB_PATH}')
+
+@app.cli.command('rebuild-stats')
+@click.option('--check', is_flag=True, help='Only report counters that drifted; exit 1 if any did.')
+def rebuild_stats_command(check):
+    """Recompute the dashboard counters from the stored rows."""
+    ensure_storage()
+    drift = storage.verify_stats()
+    for key, (stored, actual) in drift.items():
+        click.echo(f'  {key}: stored {stored}, actual {actual}')
+    if check:
+        click.echo(f'{len(drift)} counter(s) drifted' if drift else 'Counters match the stored rows')
+        raise SystemExit(1 if drift else 0)
+    storage.rebuild_stats()
+    click.echo(f'Rebuilt counters ({len(drift)} had drifted)')
+
+@app.cli.command('repair-submissions')
+@click.option('--dry-run', is_flag=True, help='List the rows without changing them.')
+def repair_submissions_command(dry_run):
+    """Put back rows whose status an old version stored in submitted_at (also done on startup)."""
+    init_storage(repair=False)  # reported row by row here instead
+    repairs = repair_swapped_statuses(dry_run)
+    for submission_id, fields in repairs.items():
+        click.echo(f'  {submission_id}: ' + ', '.join(f'{k}={v!r}' for k, v in fields.items()))
+    click.echo(f'{len(repairs)} submission(s) ' + ('would be repaired' if dry_run else 'repaired'))
+
+@app.cli.command('cleanup-uploads')
+@click.option('--dry-run', is_flag=True, help='List the files without removing them.')
+def cleanup_uploads_command(dry_run):
+    """Remove uploaded files (and their derived files) that no task or submission uses."""
+    ensure_storage()
+    for kind, folder in THUMBNAIL_SOURCES.items():
+        names = [os.path.relpath(os.path.join(root, f), folder).replace(os.sep, '/')
+                 for root, _, files in os.walk(folder) for f in files if allowed_file(f)]
+        unused = unreferenced_uploads(kind, names)
+        for name in unused:
+            click.echo(f'  {kind}/{name}')
+            if not dry_run:
+                remove_upload(kind, name)
+        click.echo(f'{"Would remove" if dry_run else "Removed"} {len(unused)} unreferenced {kind} upload(s)')
+
+@app.cli.command('compact-journal')
+def compact_journal_command():
+    """Fold the submission journal into SUBMISSIONS_DB_PATH now."""
+    folded = legacy_excel_storage().compact()
+    click.echo(f'Folded {folded} journal records into {SUBMISSIONS_DB_PATH}')
+
+@app.cli.command('rescore')
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing anything.')
+@click.option('--update-status', is_flag=True,
+              help='Also auto-approve pending submissions that now pass, and return '
+                   'auto-approved ones that no longer pass to pending.')
+@click.option('--threshold', type=float, default=SIMILARITY_THRESHOLD, show_default=True)
+@click.option('--workers', type=int, default=None, help='Scoring processes (default: all cores).')
+@click.option('--cascade', is_flag=True,
+              help='Stop early once each decision is certain (faster, but undecided-by-score rows '
+                   'get a similarity_bound instead of an exact similarity_score).')
+@click.option('--queued', is_flag=True,
+              help='Only submissions whose background scoring never finished (scoring_status queued or requeued).')
+def rescore_command(dry_run, update_status, threshold, workers, cascade, queued):
+    """Re-score every submission's proofs against its task's reference image."""
+    ensure_storage()
+    references = {t['id']: os.path.join(UPLOAD_FOLDER_TASKS, t['reference_image'])
+                  for t in storage.get_tasks() if t.get('reference_image')}
+    submissions = {}
+    jobs = []
+    for s in storage.get_submissions():
+        if queued and s.get('scoring_status') not in ('queued', 'requeued'):
+            continue
+        proofs = proof_files(s)
+        if s['task_id'] in references and proofs:
+            submissions[s['id']] = s
+            jobs.append((s['id'], references[s['task_id']],
+                         [os.path.join(UPLOAD_FOLDER_SUBMISSIONS, p) for p in proofs],
+                         threshold if cascade else None))
+
+    updates, approve, revert, failed, changed = {}, [], [], 0, 0
+    for submission_id, result, error in score_many(jobs, workers):
+        if error is None and result['score'] is None:
+            error = 'no reference image to score against'
+        # A failed row keeps its stored score and status; 0.0 is never written for it
+        if error is not None:
+            click.echo(f'{submission_id}: failed: {error}')
+            failed += 1
+            continue
+        s = submissions[submission_id]
+        fields = similarity_fields(result)
+        if stored_score(s) != stored_score(fields):
+            changed += 1
+        passes = passes_threshold(result, threshold)
+        # Only decisions the scorer made itself are revisited, never an admin's;
+        # re-used proofs stay with the admin
+        if s['status'] == 'pending' and passes and not s.get('duplicate_of'):
+            approve.append(submission_id)
+        elif (s['status'] == 'approved' and not passes
+              and str(s.get('admin_notes') or '').startswith(AUTO_APPROVED_PREFIX)):
+            revert.append(submission_id)
+        updates[submission_id] = fields
+
+    click.echo(f'Scored {len(updates)} submissions ({failed} failed and left unchanged); '
+               f'{changed} scores changed')
+    click.echo(f'{len(approve)} pending would pass and {len(revert)} auto-approved would no longer pass '
+               f'at threshold {threshold:.1%}')
+    for submission_id in approve:
+        click.echo(f'  approve {submission_id}: {similarity_label(updates[submission_id], 1)}')
+    for submission_id in revert:
+        click.echo(f'  revert  {submission_id}: {similarity_label(updates[submission_id], 1)}')
+    if dry_run:
+        click.echo('Dry run: nothing written')
+        return
+    approve, revert = set(approve), set(revert)
+    # One transaction: the workbook (or journal) is written once for the whole batch
+    with storage.transaction(('submissions',)) as tx:
+        for submission_id, fields in updates.items():
+            current = tx.get_submission(submission_id)
+            if not current:
+                continue
+            # Skip status changes if the row moved on while scoring ran
+            if update_status and submission_id in approve and current['status'] == 'pending':
+                fields.update(status='approved',
+                              admin_notes=f'{AUTO_APPROVED_PREFIX}: {similarity_label(fields, 1)} similarity match')
+            elif (update_status and submission_id in revert and current['status'] == 'approved'
+                  and current.get('admin_notes') == submissions[submission_id].get('admin_notes')):
+                fields.update(status='pending', admin_notes='')
+            tx.update_submission(submission_id, fields)
+    click.echo(f'Wrote {len(updates)} submissions' + (' and their statuses' if update_status else ''))
+
+@app.cli.command('build-duplicate-index')
+def build_duplicate_index_command():
+    """Rebuild DUPLICATE_INDEX_PATH from every stored proof image."""
+    from similarity import load_image, perceptual_hash
+
+    ensure_storage()
+    entries = []
+    for submission in storage.get_submissions():
+        for proof in proof_files(submission):
+            path = os.path.join(UPLOAD_FOLDER_SUBMISSIONS, proof)
+            if not os.path.exists(path):
+                continue
+            try:
+                entries.append((perceptual_hash(load_image(path)), submission['id'], proof))
+            except Exception as e:
+                click.echo(f'Skipping {proof}: {e}')
+    duplicate_index.rebuild(entries)
+    click.echo(f'Indexed {len(entries)} proof images into {DUPLICATE_INDEX_PATH}')
+
 # ------------------------ Error handlers ------------------------------
 @app.errorhandler(404)
 def not_found_error(_):
@@ -554,6 +1192,15 @@ def not_found_error(_):
     <a href="/">← Back to Home</a>
     """, 404
 
+@app.errorhandler(413)
+def too_large_error(_):
+    flash(f'Upload too large: each image must be at most {format_size(MAX_FILE_SIZE)}.', 'error')
+    if request.endpoint == 'submit_task':
+        return redirect(url_for('task_detail', task_id=request.view_args['task_id']))
+    if request.endpoint == 'admin_add_task':
+        return redirect(url_for('admin_tasks'))
+    return redirect(url_for('index'))
+
 @app.errorhandler(500)
 def internal_error(_):
     return """
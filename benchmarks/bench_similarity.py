@@ -0,0 +1,159 @@
+"""
+Similarity-engine benchmark: decode, preprocessing, per-metric and end-to-end
+scoring cost at several source resolutions, on synthetic reference/proof
+pairs, and how each preprocessing mode separates similar from different proofs.
+"""
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity as ssim
+
+from benchmarks.common import max_rss_kib, measure, peak_memory
+import similarity
+
+SIZES = [(640, 480), (1280, 960), (1920, 1080), (4000, 3000)]
+PREPROCESS_MODES = ['', 'denoise', 'clahe', 'denoise,clahe']
+
+
+def synthetic_image(width, height, seed):
+    """A screenshot-like picture: gradient background, shapes and text."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.dstack([(x + y) / 2, np.broadcast_to(x, (height, width)),
+                     np.broadcast_to(y, (height, width))]).astype(np.uint8).copy()
+    scale = max(width, height) / 640
+    for _ in range(40):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        r = int(rng.integers(5, 60) * scale)
+        if rng.random() < 0.5:
+            cv2.circle(img, (cx, cy), r, color, -1)
+        else:
+            cv2.rectangle(img, (cx, cy), (cx + r, cy + r // 2), color, -1)
+    for i in range(10):
+        cv2.putText(img, f'Task {seed}-{i}', (int(rng.integers(0, width // 2)), int(rng.integers(20, height))),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), max(1, int(2 * scale)))
+    return img
+
+
+def similar_variant(img, seed):
+    """The same picture re-captured: slightly cropped, brighter and noisy."""
+    rng = np.random.default_rng(seed)
+    h, w = img.shape[:2]
+    crop = img[h // 50:h - h // 50, w // 50:w - w // 50]
+    out = cv2.resize(crop, (w, h)).astype(np.int16) + 12
+    out += rng.normal(0, 6, out.shape).astype(np.int16)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def make_pairs(directory, sizes):
+    """Write reference, similar and different JPEGs per size; returns {size: paths}."""
+    pairs = {}
+    for i, (w, h) in enumerate(sizes):
+        ref = synthetic_image(w, h, seed=i)
+        paths = {}
+        for name, img in (('reference', ref), ('similar', similar_variant(ref, i)),
+                          ('different', synthetic_image(w, h, seed=100 + i))):
+            paths[name] = os.path.join(directory, f'{w}x{h}_{name}.jpg')
+            cv2.imwrite(paths[name], img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        pairs[f'{w}x{h}'] = paths
+    return pairs
+
+
+def bench_preprocess(paths, repeat):
+    """Per-mode scoring cost and exact scores of the similar and different proofs."""
+    reference = similarity.load_image(paths['reference'])
+    proofs = {kind: similarity.load_image(paths[kind]) for kind in ('similar', 'different')}
+    modes = {}
+    for mode in PREPROCESS_MODES:
+        steps = similarity.preprocess_steps(mode)
+        ref = similarity.extract_features(similarity.preprocess(reference, steps))
+        scores = {kind: round(similarity.score_features(ref, img, steps=steps)['score'], 4)
+                  for kind, img in proofs.items()}
+        modes[mode or 'none'] = dict(
+            scores, margin=round(scores['similar'] - scores['different'], 4),
+            score=measure(lambda: similarity.score_features(ref, proofs['similar'], steps=steps), repeat))
+    return modes
+
+
+def bench_size(paths, repeat):
+    ref_path, proof_path = paths['reference'], paths['similar']
+    ref = similarity.load_reference_features(ref_path)
+    height, width = ref['gray'].shape
+    img = cv2.resize(similarity.load_image(proof_path), (width, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    result = {
+        'file_kib': round(os.path.getsize(proof_path) / 1024, 1),
+        'working_size': f'{width}x{height}',
+        'decode': measure(lambda: similarity.load_image(proof_path), repeat),
+        'build_reference_features': measure(lambda: similarity.build_reference_features(ref_path), repeat),
+        'preprocess': dict(
+            {name: measure(lambda step=step: step(img), repeat)
+             for name, step in similarity.PREPROCESS_STEPS.items()},
+            # the filter 'denoise' stands in for, at the same working size
+            bilateral=measure(lambda: cv2.bilateralFilter(img, 9, 75, 75), repeat)),
+        'preprocess_modes': bench_preprocess(paths, repeat),
+        'metrics': {
+            'ssim': measure(lambda: ssim(ref['gray'], gray), repeat),
+            'histogram': measure(lambda: cv2.compareHist(ref['hist'], similarity._histogram(img),
+                                                         cv2.HISTCMP_CORREL), repeat),
+            'hash': measure(lambda: similarity._average_hash(gray), repeat),
+            'orb': measure(lambda: similarity._orb_similarity(ref['orb'], similarity._orb_descriptors(gray)),
+                           repeat),
+        },
+        'score': {},
+    }
+    threshold = 0.5
+    for kind in ('similar', 'different'):
+        path = paths[kind]
+        full = similarity.score_similarity(ref_path, path)
+        cascade = similarity.score_similarity(ref_path, path, threshold, cascade=True)
+        result['score'][kind] = {
+            'value': round(full['score'], 4),
+            'full': measure(lambda: similarity.score_similarity(ref_path, path), repeat),
+            'cascade': dict(measure(lambda: similarity.score_similarity(ref_path, path, threshold, cascade=True),
+                                    repeat), stages=cascade['stages']),
+        }
+    _, result['score_peak_kib'] = peak_memory(lambda: similarity.score_similarity(ref_path, proof_path))
+    return result
+
+
+def run(sizes=SIZES, repeat=5):
+    results = {'max_dimension': similarity.SIMILARITY_MAX_DIMENSION,
+               'preprocess': ','.join(similarity.PREPROCESS), 'sizes': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = make_pairs(directory, sizes)
+        for size, paths in pairs.items():
+            results['sizes'][size] = bench_size(paths, repeat)
+        three = [pairs[size]['similar'] for size in list(pairs)[:1] * 3]
+        ref_path = pairs[list(pairs)[0]]['reference']
+        results['submission_3_images'] = measure(
+            lambda: similarity.score_submission(ref_path, three), repeat)
+    results['max_rss_kib'] = max_rss_kib()
+    return results
+
+
+def summary(results):
+    lines = [f"similarity (max dimension {results['max_dimension']})",
+             f"{'size':>10} {'decode':>8} {'ssim':>8} {'hist':>8} {'hash':>8} {'orb':>8} "
+             f"{'full':>8} {'cascade':>8} {'peakKiB':>9}"]
+    for size, r in results['sizes'].items():
+        m = r['metrics']
+        lines.append(f"{size:>10} {r['decode']['median_ms']:8.1f} {m['ssim']['median_ms']:8.1f} "
+                     f"{m['histogram']['median_ms']:8.1f} {m['hash']['median_ms']:8.1f} "
+                     f"{m['orb']['median_ms']:8.1f} {r['score']['different']['full']['median_ms']:8.1f} "
+                     f"{r['score']['different']['cascade']['median_ms']:8.1f} {r['score_peak_kib']:9.0f}")
+    lines.append(f"3-image submission: {results['submission_3_images']['median_ms']:.1f} ms")
+    modes = [mode or 'none' for mode in PREPROCESS_MODES]
+    lines += ['preprocessing (step median ms; similar-different margin per mode)',
+              f"{'size':>10} {'denoise':>8} {'clahe':>8} {'bilat':>8} " + ' '.join(f'{m:>14}' for m in modes)]
+    for size, r in results['sizes'].items():
+        p = r['preprocess']
+        lines.append(f"{size:>10} {p['denoise']['median_ms']:8.2f} {p['clahe']['median_ms']:8.2f} "
+                     f"{p['bilateral']['median_ms']:8.2f} "
+                     + ' '.join(f"{r['preprocess_modes'][m]['margin']:14.4f}" for m in modes))
+    return '\n'.join(lines)
@@ -0,0 +1,69 @@
+"""
+Startup benchmark: what a fresh process pays before it can serve, measured
+in clean subprocesses (nothing imported or cached yet) in an empty data
+directory.
+
+* import_app    - `import app`, what every worker (and CLI command) pays
+* first_request - the first GET / after that, which initialises storage
+* warm_up       - app.warm_up(), what the gunicorn master adds under preload
+* similarity    - `import similarity` alone, the part warm_up() front-loads
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ROOT, summarize
+
+# `import app` should stay under this (ms) on a typical machine
+STARTUP_TARGET_MS = 500
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+served = time.perf_counter()
+app.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({'import_app': (imported - start) * 1000, 'first_request': (served - imported) * 1000,
+                  'warm_up': (warmed - served) * 1000}))
+'''
+
+SIMILARITY_PROBE = '''
+import json, time
+start = time.perf_counter()
+import similarity
+print(json.dumps({'similarity': (time.perf_counter() - start) * 1000}))
+'''
+
+
+def probe(code, directory):
+    env = dict(os.environ, PYTHONPATH=ROOT, LOG_LEVEL='WARNING', STORAGE_BACKEND='excel')
+    out = subprocess.run([sys.executable, '-c', code], cwd=directory, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(repeat=5, target_ms=STARTUP_TARGET_MS):
+    samples = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            for code in (PROBE, SIMILARITY_PROBE):
+                for name, value in probe(code, directory).items():
+                    samples.setdefault(name, []).append(value)
+    results = {name: summarize(times) for name, times in samples.items()}
+    results['target_ms'] = target_ms
+    results['meets_target'] = results['import_app']['median_ms'] <= target_ms
+    return results
+
+
+def summary(results):
+    lines = ['startup (median ms)']
+    for name in ('import_app', 'first_request', 'warm_up', 'similarity'):
+        lines.append(f"{name:>14} {results[name]['median_ms']:10.1f}")
+    verdict = 'OK' if results['meets_target'] else 'OVER TARGET'
+    lines.append(f"import_app target {results['target_ms']} ms: {verdict}")
+    return '\n'.join(lines)
@@ -0,0 +1,126 @@
+"""
+Storage benchmark: latency of the operations the app performs, per backend,
+on synthetic databases of several sizes.
+"""
+import itertools
+import os
+import random
+import tempfile
+import uuid
+
+from benchmarks.common import max_rss_kib, measure, peak_memory
+from storage import TABLES, ExcelStorage, SQLiteStorage
+
+ROWS = [1000, 10000]
+BACKENDS = ['excel', 'excel+journal', 'sqlite']
+TASKS = 50
+
+
+def synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    tasks = [{'id': f'task{i:04d}', 'title': f'Task {i}', 'description': 'Benchmark task ' * 5,
+              'reference_image': f'task{i:04d}.jpg', 'created_at': '2024-01-01 00:00:00',
+              'status': 'active'} for i in range(TASKS)]
+    submissions = []
+    for i in range(count):
+        submissions.append({
+            'id': f'sub{i:07d}', 'task_id': tasks[rng.randrange(TASKS)]['id'],
+            'user_name': f'User {i}', 'user_email': f'user{i}@example.com',
+            'mobile_number': f'9{rng.randrange(10**9):09d}',
+            'proof_image': f'proof_{i}_1.jpg,proof_{i}_2.jpg',
+            'submitted_at': '2024-01-01 12:00:00',
+            'status': rng.choice(['pending', 'approved', 'rejected']), 'admin_notes': '',
+            'account_holder_name': f'User {i}', 'bank_account_number': f'{rng.randrange(10**12):012d}',
+            'bank_name': 'Bank', 'ifsc_code': 'BANK0001234', 'branch_name': 'Main',
+            'confirmation_mobile': '', 'similarity_score': round(rng.random(), 4),
+            'image_scores': '', 'scoring_status': 'done', 'scoring_stages': '', 'duplicate_of': '',
+        })
+    return tasks, submissions
+
+
+def open_storage(backend, directory):
+    if backend == 'sqlite':
+        return SQLiteStorage(os.path.join(directory, 'bench.db'))
+    journal = os.path.join(directory, 'journal.jsonl') if backend == 'excel+journal' else None
+    return ExcelStorage(os.path.join(directory, 'tasks.xlsx'), os.path.join(directory, 'submissions.xlsx'),
+                        journal, compact_interval=0)
+
+
+def populate(backend, directory, tasks, submissions):
+    if backend == 'sqlite':
+        db = open_storage(backend, directory)
+        db.init()
+        with db.transaction():
+            for table, rows in (('tasks', tasks), ('submissions', submissions)):
+                for row in rows:
+                    db._insert(table, row)
+        return
+    ExcelStorage._write_rows(os.path.join(directory, 'tasks.xlsx'), 'Tasks', TABLES['tasks'], tasks)
+    ExcelStorage._write_rows(os.path.join(directory, 'submissions.xlsx'), 'Submissions',
+                             TABLES['submissions'], submissions)
+
+
+def bench_backend(backend, rows, repeat):
+    tasks, submissions = synthetic_rows(rows)
+    ids = [s['id'] for s in submissions]
+    rng = random.Random(1)
+    counter = itertools.count()
+    heavy = max(1, min(repeat, 3))  # full reloads/rewrites are slow at 100k rows
+    with tempfile.TemporaryDirectory() as directory:
+        populate(backend, directory, tasks, submissions)
+
+        def cold_load():
+            return open_storage(backend, directory).get_submissions()
+
+        _, cold_peak = peak_memory(cold_load)
+        storage = open_storage(backend, directory)
+        storage.get_submissions()
+
+        # the cursor of a page near the end of the listing
+        deep_cursor = storage.query_submissions(limit=max(1, rows - 100))[1]
+
+        def add():
+            row = dict(submissions[0], id=f'new{next(counter)}-{uuid.uuid4().hex[:6]}', status='pending')
+            storage.add_submission(row)
+
+        result = {
+            'cold_load': measure(cold_load, heavy, warmup=0),
+            'cold_load_peak_kib': cold_peak,
+            'get_submissions': measure(storage.get_submissions, repeat),
+            'get_submissions_by_task': measure(lambda: storage.get_submissions(task_id='task0007'), repeat),
+            'get_submissions_by_status': measure(lambda: storage.get_submissions(status='pending'), repeat),
+            'get_submission': measure(lambda: storage.get_submission(rng.choice(ids)), repeat),
+            'count_submissions': measure(lambda: storage.count_submissions('approved'), repeat),
+            'query_page': measure(lambda: storage.query_submissions(limit=50), repeat),
+            'query_page_deep': measure(lambda: storage.query_submissions(limit=50, after=deep_cursor), repeat),
+            'query_page_filtered': measure(lambda: storage.query_submissions(
+                status='pending', sort='similarity', min_score=0.5, limit=50), repeat),
+            'add_submission': measure(add, heavy),
+            'update_submission_status': measure(
+                lambda: storage.update_submission(rng.choice(ids), {'status': 'approved',
+                                                                    'admin_notes': 'bench'}), heavy),
+        }
+        if backend == 'excel+journal':
+            result['compact'] = measure(storage.compact, 1, warmup=0)
+        result['file_kib'] = round(sum(os.path.getsize(os.path.join(directory, f))
+                                       for f in os.listdir(directory)) / 1024, 1)
+    return result
+
+
+def run(rows=ROWS, backends=BACKENDS, repeat=5):
+    results = {}
+    for count in rows:
+        for backend in backends:
+            results[f'{backend}/{count}'] = bench_backend(backend, count, repeat)
+    return {'runs': results, 'max_rss_kib': max_rss_kib()}
+
+
+def summary(results):
+    ops = [('cold_load', 'cold load'), ('get_submissions', 'get all'),
+           ('get_submissions_by_status', 'by status'), ('get_submission', 'get one'),
+           ('query_page', 'page'), ('query_page_deep', 'deep page'),
+           ('add_submission', 'add'), ('update_submission_status', 'update')]
+    lines = ['storage (median ms)', f"{'backend/rows':>20} " + ' '.join(f'{label:>10}' for _, label in ops)]
+    for name, r in results['runs'].items():
+        lines.append(f'{name:>20} ' + ' '.join(f"{r[op]['median_ms']:10.2f}" for op, _ in ops))
+    return '\n'.join(lines)
@@ -0,0 +1,52 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.10]
+
+Every median_ms present in both files is listed with its relative change;
+the exit status is 1 if any got slower by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def medians(node, prefix=''):
+    """Flatten {..: {'median_ms': x}} into {'path/to/op': x}."""
+    found = {}
+    if isinstance(node, dict):
+        if 'median_ms' in node:
+            found[prefix.rstrip('/')] = node['median_ms']
+        for key, value in node.items():
+            found.update(medians(value, f'{prefix}{key}/'))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown (0.10 = 10%%)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old['environment'].get('commit') or args.baseline} -> {new['environment'].get('commit') or args.candidate}")
+
+    before, after = medians(old), medians(new)
+    regressions = 0
+    for name in sorted(before.keys() & after.keys()):
+        a, b = before[name], after[name]
+        change = (b - a) / a if a else 0.0
+        flag = ''
+        if change > args.threshold:
+            flag, regressions = '  REGRESSION', regressions + 1
+        print(f'{name:<70} {a:10.2f} {b:10.2f} {change:+8.1%}{flag}')
+    print(f'{regressions} regression(s) above {args.threshold:.0%}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Run the benchmark suites and save the results as JSON.
+
+    python -m benchmarks.run                         # every suite, default sizes
+    python -m benchmarks.run --suite storage --rows 1000 10000 100000
+    python -m benchmarks.run --output bench/$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare old.json new.json
+"""
+import argparse
+
+from benchmarks import bench_similarity, bench_startup, bench_storage
+from benchmarks.common import environment, save_results
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=['all', 'similarity', 'storage', 'startup'], default='all')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=bench_similarity.SIZES,
+                        help='Image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--rows', nargs='+', type=int, default=bench_storage.ROWS,
+                        help='Submission row counts')
+    parser.add_argument('--backends', nargs='+', choices=bench_storage.BACKENDS, default=bench_storage.BACKENDS)
+    parser.add_argument('--startup-target', type=float, default=bench_startup.STARTUP_TARGET_MS,
+                        help='Allowed `import app` time in ms')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='benchmark-results.json')
+    args = parser.parse_args(argv)
+
+    results = {'environment': environment()}
+    if args.suite in ('all', 'similarity'):
+        results['similarity'] = bench_similarity.run(args.sizes, args.repeat)
+        print(bench_similarity.summary(results['similarity']))
+    if args.suite in ('all', 'storage'):
+        results['storage'] = bench_storage.run(args.rows, args.backends, args.repeat)
+        print(bench_storage.summary(results['storage']))
+    if args.suite in ('all', 'startup'):
+        results['startup'] = bench_startup.run(args.repeat, args.startup_target)
+        print(bench_startup.summary(results['startup']))
+    save_results(args.output, results)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Background file cleanup.
+
+Deleting a task removes its rows in one transaction and returns; removing
+the files those rows referenced (proof images, the reference image, its
+feature file and their thumbnails) is queued here and done by a daemon
+thread, so the admin request does not wait on reference checks and unlinks.
+A job lost because a worker exited mid-queue only leaves orphaned files,
+which `flask cleanup-uploads` sweeps up.
+"""
+import atexit
+import logging
+import queue
+import time
+
+from locks import per_process_thread
+
+logger = logging.getLogger(__name__)
+
+
+class CleanupQueue:
+    """Per-process FIFO of cleanup jobs, run in order by one daemon thread."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._queue = queue.Queue()
+        self._ensure_thread = per_process_thread('upload-cleanup', self._loop, setup=self._setup)
+
+    def submit(self, *args):
+        """Queue `handler(*args)`."""
+        self._ensure_thread()
+        self._queue.put(args)
+
+    def _setup(self):
+        self._queue = queue.Queue()  # not the parent's
+        atexit.register(self.drain, timeout=10)
+
+    def _loop(self):
+        while True:
+            args = self._queue.get()
+            try:
+                self.handler(*args)
+            except Exception:
+                logger.exception('Error cleaning up files for %r', args)
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout=None):
+        """Wait until every queued job has run; True unless the timeout expired."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
@@ -0,0 +1,128 @@
+"""
+Perceptual-hash index of every proof image, for spotting recycled proofs.
+
+Each proof's 64-bit pHash (computed by the scoring job, see similarity.py)
+is appended to a JSON-lines file and kept in memory as a BK-tree, so
+"any earlier proof within Hamming distance k" is answered without
+comparing against every stored image. Every web worker replays lines the
+others appended before it queries, and check-and-add runs under a file
+lock, so two copies of one screenshot uploaded at once still match. As with
+the submission journal, a line half-written by a killed worker is cut off
+before the next append and lines that don't parse are skipped.
+
+Line shape:
+    {"hash": "<16 hex digits>", "submission_id": "...", "image": "<filename>"}
+"""
+import json
+import os
+import threading
+
+from journal import parse_lines, repair_tail
+from locks import FileLock
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance."""
+
+    def __init__(self):
+        self.root = None  # [hash, items, {distance: child}]
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] for every stored hash within max_distance."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # Triangle inequality: only these subtrees can hold matches
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class DuplicateIndex:
+    """BK-tree of proof hashes backed by an append-only JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path)
+        self._guard = threading.Lock()
+        self._tree = BKTree()
+        self._inode = None
+        self._offset = 0
+
+    def _catch_up(self):
+        """Load lines appended since the last call (or everything after a rebuild)."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            self._tree, self._inode, self._offset = BKTree(), inode, 0
+        if inode is None:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for entry in parse_lines(data[:end], self.path):
+            self._tree.add(int(entry['hash'], 16), (entry['submission_id'], entry['image']))
+        self._offset += end
+
+    def check_and_add(self, submission_id, hashes, max_distance):
+        """
+        Index a submission's images and return earlier proofs that match any
+        of them, as [(distance, submission_id, image)] sorted by distance.
+        `hashes` is [(hex_hash, image_filename)].
+        """
+        with self._guard, self.lock:
+            self._catch_up()
+            matches = {}
+            for value, _ in hashes:
+                for distance, (other_id, image) in self._tree.search(int(value, 16), max_distance):
+                    if other_id != submission_id and distance < matches.get((other_id, image), max_distance + 1):
+                        matches[(other_id, image)] = distance
+            lines = ''.join(json.dumps({'hash': value, 'submission_id': submission_id, 'image': image}) + '\n'
+                            for value, image in hashes)
+            with open(self.path, 'a+b') as f:
+                # _catch_up() read up to the last newline, which is where this cuts
+                repair_tail(f)
+                f.write(lines.encode('utf-8'))
+            self._inode = os.stat(self.path).st_ino
+            self._offset += len(lines.encode('utf-8'))
+            for value, image in hashes:
+                self._tree.add(int(value, 16), (submission_id, image))
+        return sorted((distance, other_id, image) for (other_id, image), distance in matches.items())
+
+    def rebuild(self, entries):
+        """Replace the index with `entries` ([(hex_hash, submission_id, image)])."""
+        tmp = self.path + '.tmp'
+        with self._guard, self.lock:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for value, submission_id, image in entries:
+                    f.write(json.dumps({'hash': value, 'submission_id': submission_id, 'image': image}) + '\n')
+            os.replace(tmp, self.path)
+            self._inode = None  # reload from the new file on next use
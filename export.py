@@ -0,0 +1,68 @@
+"""
+Submission exports for payout processing, as CSV or XLSX.
+
+Rows come from storage.iter_submissions() and are written one at a time:
+CSV is produced line by line straight into the response, XLSX goes through
+openpyxl's write-only mode into a temporary file that is then streamed out
+in chunks. Neither holds the result set in memory.
+
+Cells that a spreadsheet would read as a formula (leading = + - @) are
+prefixed with a quote, so a user-supplied name cannot run in finance's Excel.
+"""
+import csv
+import io
+
+from openpyxl import Workbook
+
+EXPORT_COLUMNS = ['id', 'task_id', 'task_title', 'submitted_at', 'status', 'admin_notes',
+                  'similarity_score', 'similarity_bound', 'user_name', 'user_email', 'mobile_number',
+                  'account_holder_name', 'bank_account_number', 'bank_name', 'ifsc_code',
+                  'branch_name', 'confirmation_mobile']
+
+CHUNK_SIZE = 64 * 1024
+
+
+def spreadsheet_safe(value):
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value)
+    return "'" + value if value[:1] in ('=', '+', '-', '@', '\t', '\r') else value
+
+
+def iter_csv(rows, columns=EXPORT_COLUMNS):
+    """CSV text for `rows`, one line per chunk (UTF-8 BOM first, for Excel)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield '\ufeff' + line(columns)
+    for row in rows:
+        yield line([spreadsheet_safe(row.get(c)) for c in columns])
+
+
+def write_xlsx(rows, fileobj, columns=EXPORT_COLUMNS):
+    """Write `rows` to `fileobj` as a write-only workbook and rewind it."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Submissions')
+    ws.append(columns)
+    for row in rows:
+        ws.append([spreadsheet_safe(row.get(c)) for c in columns])
+    wb.save(fileobj)
+    fileobj.seek(0)
+    return fileobj
+
+
+def iter_file(fileobj, chunk_size=CHUNK_SIZE):
+    """Stream a file's contents, closing it at the end."""
+    try:
+        yield from iter(lambda: fileobj.read(chunk_size), b'')
+    finally:
+        fileobj.close()
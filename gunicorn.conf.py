@@ -0,0 +1,32 @@
+"""
+Gunicorn settings (picked up automatically from the working directory).
+
+With GUNICORN_PRELOAD (the default) the app is imported once in the master
+and warmed up before the workers fork: storage is initialised, the admin
+password hashed and the similarity engine (OpenCV, scikit-image, numpy)
+imported there, so workers share those pages copy-on-write instead of each
+paying the import on their first upload. Without preload every worker
+imports the app itself and loads the similarity engine on first use.
+
+Bind address and worker count keep gunicorn's defaults, which read $PORT
+and $WEB_CONCURRENCY.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        import app
+
+        app.warm_up()
+
+
+def worker_exit(server, worker):
+    # Runs in the worker: stop its metrics snapshot from being merged into
+    # later scrapes. Workers that die without getting here (SIGKILL, OOM) are
+    # dropped by the next scrape, which checks that each file's pid is alive.
+    import metrics
+
+    metrics.registry.discard()
@@ -0,0 +1,149 @@
+"""
+Append-only write-ahead journal for submission mutations.
+
+Instead of rewriting submissions.xlsx on every upload, each mutation is
+appended to a JSON-lines file. A writer thread group-commits: whatever
+records queued up while the previous fsync was running are written and
+fsynced together, then every caller in that batch is released. Readers
+replay the journal on top of the workbook snapshot, and a compactor
+periodically folds the journal back into the .xlsx.
+
+Record shapes:
+    {"op": "add", "row": {...}}
+    {"op": "update", "id": "...", "fields": {...}}
+    {"op": "delete", "column": "task_id", "value": "..."}
+
+A writer killed mid-write leaves a partial last line. The next append cuts
+it off first (under the lock, so it cannot be a write in progress), and
+readers skip a line that does not parse instead of failing on the file.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+from locks import FileLock, per_process_thread
+
+logger = logging.getLogger(__name__)
+
+
+def repair_tail(f):
+    """
+    Truncate a file opened 'a+b' back to its last newline, dropping a line a
+    dead writer left half-written. Call it holding the file's lock, before
+    appending. Returns the number of bytes dropped.
+    """
+    size = f.seek(0, os.SEEK_END)
+    if not size:
+        return 0
+    f.seek(size - 1)
+    if f.read(1) == b'\n':
+        return 0
+    keep, pos = 0, size
+    while pos > 0:
+        step = min(pos, 64 * 1024)
+        pos -= step
+        f.seek(pos)
+        newline = f.read(step).rfind(b'\n')
+        if newline >= 0:
+            keep = pos + newline + 1
+            break
+    f.truncate(keep)
+    logger.warning('Dropped %d bytes of a partial line at the end of %s', size - keep, f.name)
+    return size - keep
+
+
+def parse_lines(data, path):
+    """JSON objects of the complete lines in `data`; corrupt lines are logged and skipped."""
+    records = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.error('Skipping corrupt line in %s: %.80r', path, line)
+    return records
+
+
+class SubmissionJournal:
+    """Group-committed JSONL journal guarded by a cross-process file lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path)
+        self._queue = queue.Queue()
+        self._ensure_writer = per_process_thread('journal-writer', self._writer_loop, setup=self._new_queue)
+
+    # -- writing -----------------------------------------------------------
+    def append(self, *records):
+        """Durably append records; returns once their batch is fsynced."""
+        self._ensure_writer()
+        done, error = threading.Event(), []
+        lines = ''.join(json.dumps(r, default=str) + '\n' for r in records)
+        self._queue.put((lines, done, error))
+        done.wait()
+        if error:
+            raise error[0]
+
+    def _new_queue(self):
+        self._queue = queue.Queue()  # not the parent's
+
+    def _writer_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = ''.join(lines for lines, _, _ in batch)
+            start = time.perf_counter()
+            try:
+                with self.lock, open(self.path, 'a+b') as f:
+                    repair_tail(f)
+                    f.write(data.encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                metrics.observe('microtasks_journal_commit_seconds', time.perf_counter() - start)
+                metrics.inc('microtasks_journal_records_total', data.count('\n'))
+            except Exception as e:
+                for _, _, error in batch:
+                    error.append(e)
+            for _, done, _ in batch:
+                done.set()
+
+    # -- reading -----------------------------------------------------------
+    def signature(self):
+        """(inode, size) of the journal, or None if it does not exist."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def read(self, offset=0):
+        """Return (records, new_offset) for complete lines after `offset`."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1  # ignore a line that is still being written
+        return parse_lines(data[:end], self.path), offset + end
+
+    def truncate_prefix(self, offset):
+        """Drop the first `offset` bytes (already compacted). Caller holds self.lock."""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            rest = f.read()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(rest)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
@@ -0,0 +1,117 @@
+"""
+Advisory file locks shared by every process that touches the data files.
+
+Locks are taken on a sidecar "<path>.lock" file with fcntl.flock, so they
+serialise gunicorn workers as well as threads. Platforms without fcntl
+(Windows) fall back to a process-local lock, which is still correct for
+the single-process development server.
+
+PerProcess and per_process_thread() cover the other side of forking
+workers: background threads and process pools do not survive fork(), so
+each process creates its own on first use.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _PathLock:
+    """Per-path state shared by every FileLock instance in this process."""
+
+    def __init__(self):
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+
+class FileLock:
+    """Exclusive lock on `<path>.lock`, usable as a (re-entrant) context manager."""
+
+    _registry = {}
+    _registry_guard = threading.Lock()
+
+    def __init__(self, path):
+        self.lock_path = path + '.lock'
+        with self._registry_guard:
+            self._shared = self._registry.setdefault(self.lock_path, _PathLock())
+
+    def acquire(self, blocking=True):
+        shared = self._shared
+        if not shared.thread_lock.acquire(blocking):
+            return False
+        # Only the thread holding thread_lock touches depth/fd from here on.
+        if shared.depth == 0 and fcntl is not None:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                os.close(fd)
+                shared.thread_lock.release()
+                return False
+            shared.fd = fd
+        shared.depth += 1
+        return True
+
+    def release(self):
+        shared = self._shared
+        shared.depth -= 1
+        if shared.depth == 0 and shared.fd is not None:
+            fcntl.flock(shared.fd, fcntl.LOCK_UN)
+            os.close(shared.fd)
+            shared.fd = None
+        shared.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class PerProcess:
+    """
+    A value (a thread, a pool) created by `factory` on first use in each
+    process, since neither survives fork(). get(renew) also replaces it when
+    renew(value) is true, e.g. for a broken pool.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._pid = None
+        self._guard = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # The parent may have held the guard at the moment of fork()
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._guard = threading.Lock()
+
+    def get(self, renew=None):
+        if self._pid == os.getpid() and not (renew and renew(self._value)):
+            return self._value
+        with self._guard:
+            if self._pid != os.getpid() or (renew and renew(self._value)):
+                self._value = self.factory()
+                self._pid = os.getpid()
+            return self._value
+
+
+def per_process_thread(name, target, setup=None):
+    """
+    A callable that starts a daemon thread running `target`, once per
+    process. `setup` runs first, before the thread starts (e.g. to replace
+    a queue inherited from the parent process).
+    """
+    def start():
+        if setup is not None:
+            setup()
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        return thread
+    return PerProcess(start).get
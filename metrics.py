@@ -0,0 +1,242 @@
+"""
+Timing metrics for the hot paths, aggregated across gunicorn workers.
+
+Each process keeps its counters and histograms in memory. Once a metrics
+directory is configured, a daemon thread writes the process's snapshot to
+`<dir>/<pid>-<start id>.json` every few seconds; render() merges every
+worker's file into one Prometheus text exposition, so a scrape of any worker
+sees the totals of all of them. Without a directory only this process is
+reported. A worker removes its file when it exits (gunicorn.conf.py), and
+render() drops files of processes that are gone, or whose pid a newer
+process has taken over.
+
+    metrics.observe('microtasks_similarity_stage_seconds', 0.012, stage='ssim')
+    with metrics.timed('microtasks_storage_workbook_load_seconds', workbook='tasks.xlsx'):
+        ...
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from locks import per_process_thread
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the +Inf bucket is implicit
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'microtasks_http_request_duration_seconds': 'Time spent handling a request, by endpoint.',
+    'microtasks_storage_workbook_load_seconds': 'Time to parse a workbook from disk.',
+    'microtasks_storage_workbook_save_seconds': 'Time to write a workbook to disk.',
+    'microtasks_storage_transaction_seconds': 'Time a storage transaction held its locks.',
+    'microtasks_journal_commit_seconds': 'Time to write and fsync one journal batch.',
+    'microtasks_journal_records_total': 'Submission journal records written.',
+    'microtasks_similarity_stage_seconds': 'Time of one similarity stage for one proof image.',
+    'microtasks_scoring_job_seconds': 'Submission scoring time from upload to result, including queueing.',
+    'microtasks_scoring_jobs_total': 'Scoring jobs finished, by outcome.',
+    'microtasks_page_cache_requests_total': 'Public page requests by page-cache outcome (hit, miss, bypass).',
+    'microtasks_worker_last_flush_timestamp_seconds': 'When each worker last published its metrics.',
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """Counters and fixed-bucket histograms for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+        self.directory = None
+        self.interval = 5
+        self.start_id = uuid.uuid4().hex[:8]  # tells apart processes that reuse a pid
+        self._ensure_flusher_thread = per_process_thread('metrics-flusher', self._flusher_loop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A child starts empty: the parent's samples are the parent's (e.g. a
+        # gunicorn master that warmed up under preload_app), and its lock may
+        # have been held by the parent's flusher thread at the moment of fork().
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.start_id = uuid.uuid4().hex[:8]
+
+    def configure(self, directory, interval=5):
+        """Share metrics through `directory` (None keeps them process-local)."""
+        self.directory = directory or None
+        self.interval = interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # -- recording ---------------------------------------------------------
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self._ensure_flusher()
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        index = next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+        self._ensure_flusher()
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # -- sharing between workers -------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'start_id': self.start_id,
+                'time': time.time(),
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)]
+                               for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self):
+        directory = self.directory
+        if not directory:
+            return
+        path = os.path.join(directory, f'{os.getpid()}-{self.start_id}.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def discard(self):
+        """Stop publishing and remove this process's snapshot (on worker exit)."""
+        directory, self.directory = self.directory, None
+        if directory:
+            _remove(os.path.join(directory, f'{os.getpid()}-{self.start_id}.json'))
+
+    def _ensure_flusher(self):
+        if self.directory:
+            self._ensure_flusher_thread()
+
+    def _flusher_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Error writing metrics snapshot')
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        latest = {}  # pid -> (snapshot, path) of the process now holding it
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue  # a worker is replacing its file right now
+            pid = snap['pid']
+            if not _alive(pid):
+                _remove(path)
+                continue
+            if pid in latest:
+                # A reused pid: the older file belongs to a process that is gone
+                older, newer = sorted([latest[pid], (snap, path)], key=lambda entry: entry[0]['time'])
+                _remove(older[1])
+                snap, path = newer
+            latest[pid] = (snap, path)
+        return [snap for snap, _ in latest.values()]
+
+    # -- exposition --------------------------------------------------------
+    def render(self):
+        """Every worker's metrics merged, in Prometheus text format 0.0.4."""
+        counters, histograms, workers = {}, {}, []
+        for snap in self._snapshots():
+            workers.append((snap['pid'], snap['time']))
+            for name, labels, value in snap['counters']:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snap['histograms']:
+                key = _key(name, labels)
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    merged[i] += value
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'counter')
+            lines.append(f'{name}{fmt(labels)} {value}')
+        for (name, labels), values in sorted(histograms.items()):
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{fmt(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{fmt(labels)} {values[-1]:.6f}')
+            lines.append(f'{name}_count{fmt(labels)} {cumulative}')
+        describe('microtasks_worker_last_flush_timestamp_seconds', 'gauge')
+        for pid, flushed in sorted(workers):
+            lines.append(f'microtasks_worker_last_flush_timestamp_seconds{{pid="{pid}"}} {flushed:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+registry = Registry()
+configure = registry.configure
+inc = registry.inc
+observe = registry.observe
+timed = registry.timed
+render = registry.render
@@ -0,0 +1,40 @@
+"""
+In-memory cache of rendered public pages.
+
+The task list and task pages change only when a task is added, completed or
+deleted, yet each hit used to read the tasks and render Jinja templates.
+A rendered page is kept per worker together with the storage's
+tasks_version() it was rendered at, and served as-is while that version is
+current. The ETag is a hash of the page itself, so every worker hands out
+the same one and browsers revalidate with a 304.
+"""
+import hashlib
+import threading
+
+
+class PageCache:
+    """Rendered pages by key, each valid for one tasks version."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (version, body, etag)
+        self._guard = threading.Lock()
+
+    def get(self, key, version):
+        """(body, etag) rendered at `version`, or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, key, version, body):
+        """Store a rendered page; returns (body, etag)."""
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        with self._guard:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                # Pages of older versions go first, everything if that is not enough
+                stale = [k for k, entry in self._entries.items() if entry[0] != version]
+                for k in stale or list(self._entries):
+                    del self._entries[k]
+            self._entries[key] = (version, body, etag)
+        return body, etag
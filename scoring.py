@@ -0,0 +1,87 @@
+"""
+Background similarity scoring.
+
+Submissions are stored as pending straight away; the similarity check runs
+in a process pool so the upload request returns without waiting for it.
+When a job finishes, `on_result(submission_id, result, error)` is called in
+the web process with score_submission()'s result, which records the score
+and auto-approves if it passes. Jobs get the approval threshold so the
+cascade can stop early.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from locks import PerProcess
+
+logger = logging.getLogger(__name__)
+
+
+class ScoringQueue:
+    """Per-process pool of scoring workers; `workers=0` scores inline instead."""
+
+    def __init__(self, workers, on_result, threshold=None):
+        self.workers = workers
+        self.on_result = on_result
+        self.threshold = threshold
+        self._executor = PerProcess(lambda: ProcessPoolExecutor(max_workers=self.workers))
+
+    def _pool(self):
+        # Replaced if a crashed scoring process broke it
+        return self._executor.get(renew=lambda pool: getattr(pool, '_broken', False))
+
+    def submit(self, submission_id, reference_path, image_paths):
+        submitted = time.perf_counter()
+        if not self.workers:
+            self._finish(submission_id, submitted,
+                         lambda: _score(reference_path, image_paths, self.threshold))
+            return
+        future = self._pool().submit(_score, reference_path, image_paths, self.threshold)
+        future.add_done_callback(lambda f: self._finish(submission_id, submitted, f.result))
+
+    def _finish(self, submission_id, submitted, result):
+        try:
+            result, error = result(), None
+        except Exception as e:
+            result, error = None, e
+        record_timings(result, time.perf_counter() - submitted, error)
+        try:
+            self.on_result(submission_id, result, error)
+        except Exception:
+            logger.exception('Error recording similarity for %s', submission_id)
+
+
+def record_timings(result, seconds, error=None):
+    """Feed a job's per-stage timings (measured in the worker process) to metrics."""
+    metrics.inc('microtasks_scoring_jobs_total', outcome='error' if error is not None else 'ok')
+    metrics.observe('microtasks_scoring_job_seconds', seconds)
+    for image in (result or {}).get('images', ()):
+        for stage, elapsed in image.get('timings', {}).items():
+            metrics.observe('microtasks_similarity_stage_seconds', elapsed, stage=stage)
+
+
+def _score(reference_path, image_paths, threshold=None):
+    # Imported on first use: the web process only needs OpenCV if it scores inline
+    from similarity import score_submission
+
+    return score_submission(reference_path, image_paths, threshold)
+
+
+def _score_job(job):
+    submission_id, reference_path, image_paths, threshold = job
+    try:
+        return submission_id, _score(reference_path, image_paths, threshold), None
+    except Exception as e:
+        return submission_id, None, e
+
+
+def score_many(jobs, workers=None):
+    """
+    Score (submission_id, reference_path, image_paths, threshold) jobs across
+    `workers` processes (default: every core), yielding
+    (submission_id, result, error) as results arrive, in job order.
+    """
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        yield from pool.map(_score_job, jobs, chunksize=4)
@@ -0,0 +1,349 @@
+"""
+Image similarity between a task's reference image and a submitted proof.
+
+Kept free of Flask/app imports so scoring worker processes (see
+scoring.py) only load the imaging stack.
+
+Each image is decoded exactly once, at bounded resolution (see load_image).
+Everything derived from the reference image (grayscale, colour histogram,
+average hash, ORB descriptors) is computed once when the task is created
+and saved next to it as `<reference>.npz`. Scoring loads those features
+through an in-memory LRU cache and rebuilds the file on a miss, so the
+reference image itself is never decoded on the per-submission path. A
+reference that cannot be read raises, so its scoring job fails instead of
+scoring 0.0, and the failure is not cached.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from skimage.metrics import structural_similarity as ssim
+from PIL import Image, ImageOps
+import imagehash
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# ─────────────────────────── Image pipeline ──────────────────────────
+# Every image is decoded once, at reduced size, into one BGR ndarray that
+# feeds SSIM, histogram, hash and ORB alike, so per-submission CPU and
+# memory depend on SIMILARITY_MAX_DIMENSION rather than the upload size.
+SIMILARITY_MAX_DIMENSION = int(os.environ.get('SIMILARITY_MAX_DIMENSION', 1024))
+FEATURES_VERSION         = 2  # bump when the stored features change shape/meaning
+REFERENCE_CACHE_SIZE     = int(os.environ.get('REFERENCE_CACHE_SIZE', 64))
+SIMILARITY_CASCADE       = os.environ.get('SIMILARITY_CASCADE', 'True').lower() == 'true'
+SIMILARITY_AGGREGATE     = os.environ.get('SIMILARITY_AGGREGATE', 'max')  # max | mean
+SIMILARITY_PREPROCESS    = os.environ.get('SIMILARITY_PREPROCESS', '')    # e.g. denoise,clahe
+
+
+def load_image(path, max_dimension=SIMILARITY_MAX_DIMENSION):
+    """Decode an image once into a BGR array whose longest side is <= max_dimension."""
+    with Image.open(path) as img:
+        # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 instead of decoding full size
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+    arr = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    height, width = arr.shape[:2]
+    scale = max_dimension / max(height, width)
+    if scale < 1:
+        arr = cv2.resize(arr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    return arr
+
+
+# ─────────────────────────── Preprocessing ───────────────────────────
+# Optional steps applied in memory to both sides at the working size, after
+# the proof is resized to the reference (never to the original upload). The
+# reference features record the steps they were built with and are rebuilt
+# when SIMILARITY_PREPROCESS changes.
+def _denoise(img):
+    # A 3x3 Gaussian: removes JPEG/sensor speckle for well under 1 ms at
+    # 1024 px, where a bilateral filter costs tens of ms
+    return cv2.GaussianBlur(img, (3, 3), 0)
+
+
+def _clahe(img):
+    # Local contrast equalisation of the lightness channel only
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+
+PREPROCESS_STEPS = {
+    'denoise': _denoise,
+    'clahe': _clahe,
+}
+
+
+def preprocess_steps(spec):
+    """'denoise,clahe' -> ('denoise', 'clahe'); unknown names are dropped with a warning."""
+    steps = tuple(name.strip() for name in spec.split(',') if name.strip())
+    unknown = [name for name in steps if name not in PREPROCESS_STEPS]
+    if unknown:
+        logger.warning('Ignoring unknown preprocessing step(s): %s', ', '.join(unknown))
+    return tuple(name for name in steps if name in PREPROCESS_STEPS)
+
+
+PREPROCESS = preprocess_steps(SIMILARITY_PREPROCESS)
+
+
+def preprocess(img, steps=PREPROCESS, timings=None):
+    """Apply preprocessing steps to a BGR array; per-step seconds go into `timings`."""
+    for name in steps:
+        start = time.perf_counter()
+        img = PREPROCESS_STEPS[name](img)
+        if timings is not None:
+            timings[f'preprocess_{name}'] = time.perf_counter() - start
+    return img
+
+
+def _histogram(img):
+    # Flattened: cv2.compareHist gives out-of-range results on 3-D histograms
+    return cv2.calcHist([img], [0, 1, 2], None, [50, 50, 50],
+                        [0, 256, 0, 256, 0, 256]).ravel()
+
+
+def _orb_descriptors(gray):
+    _, descriptors = cv2.ORB_create(nfeatures=500).detectAndCompute(gray, None)
+    return descriptors if descriptors is not None else np.zeros((0, 32), np.uint8)
+
+
+def _average_hash(gray):
+    return imagehash.average_hash(Image.fromarray(gray), hash_size=16).hash
+
+
+def _orb_similarity(des1, des2):
+    if not len(des1) or not len(des2):
+        return 0.0
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(des1, des2)
+    # Feature similarity based on good matches, normalised to 0-1
+    good_matches = [m for m in matches if m.distance < 50]
+    return min(len(good_matches) / 20, 1.0)
+
+
+def perceptual_hash(img):
+    """64-bit pHash of a BGR array as 16 hex digits (for the duplicate index)."""
+    return str(imagehash.phash(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))))
+
+
+def extract_features(img):
+    """Grayscale, colour histogram, 16x16 average hash and ORB descriptors of one array."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return {
+        'gray': gray,
+        'hist': _histogram(img),
+        'ahash': _average_hash(gray),
+        'orb': _orb_descriptors(gray),
+    }
+
+
+# ─────────────────────── Reference feature store ─────────────────────
+def reference_features_path(reference_path):
+    return reference_path + '.npz'
+
+
+def build_reference_features(reference_path):
+    """Compute the reference image's features and save them alongside it."""
+    features = extract_features(preprocess(load_image(reference_path)))
+    features['version'] = np.array(FEATURES_VERSION)
+    features['max_dimension'] = np.array(SIMILARITY_MAX_DIMENSION)
+    features['preprocess'] = np.array(','.join(PREPROCESS))
+    path = reference_features_path(reference_path)
+    # Scoring processes may all miss the same reference at once
+    tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **features)
+    os.replace(tmp, path)
+    return features
+
+
+def load_reference_features(reference_path):
+    """Features for a reference image, from memory, the .npz, or rebuilt (OSError if unreadable)."""
+    return _cached_reference_features(reference_path, os.stat(reference_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=REFERENCE_CACHE_SIZE)
+def _cached_reference_features(reference_path, mtime_ns):
+    path = reference_features_path(reference_path)
+    try:
+        if os.stat(path).st_mtime_ns >= mtime_ns:
+            with np.load(path) as data:
+                # Files from before preprocessing existed were built without it
+                steps = str(data['preprocess']) if 'preprocess' in data.files else ''
+                if (int(data['version']) == FEATURES_VERSION
+                        and int(data['max_dimension']) == SIMILARITY_MAX_DIMENSION
+                        and steps == ','.join(PREPROCESS)):
+                    return {name: data[name] for name in data.files}
+    except (OSError, KeyError, ValueError):
+        pass
+    # Raises if the reference cannot be read; lru_cache keeps only results
+    return build_reference_features(reference_path)
+
+
+# ─────────────────────────── Scoring ─────────────────────────────────
+# (stage, weight, lowest value, highest value), cheapest first. Hash and
+# histogram take a few ms, ORB ~10 ms and SSIM ~15x that at 1024 px.
+# The cascade's savings are on fails: after the first three stages the score
+# can still drop by 0.3 in SSIM, so their best lower bound is 0.7 - 0.3 = 0.4
+# and a pass at a threshold above 0.4 always runs SSIM too. Moving SSIM
+# earlier would only let passes skip ORB, and fails could no longer skip SSIM.
+SCORING_STAGES = (
+    ('hash',      0.2,  0.0, 1.0),
+    ('histogram', 0.25, -1.0, 1.0),  # correlation
+    ('features',  0.25, 0.0, 1.0),   # ORB matches
+    ('ssim',      0.3,  -1.0, 1.0),
+)
+
+
+def score_similarity(admin_image_path, user_image, threshold=None,
+                     cascade=SIMILARITY_CASCADE):
+    """
+    Weighted similarity (0.0-1.0) of a proof (a path or a load_image() array)
+    to its task's reference image.
+
+    Returns {'score', 'stages', 'exact', 'bound', 'timings'}. With a
+    threshold and cascade on, stages stop once the remaining ones cannot move
+    the score across the threshold; 'score' is then only a bound on the
+    decided side, and 'bound' says which: 'lower' for a pass, 'upper' for a
+    fail (None for an exact score). 'timings' holds the seconds each step
+    took, for the metrics endpoint. Errors (an unreadable reference, a
+    failing metric) raise rather than scoring 0.0.
+    """
+    timings = {}
+    # Decode the proof once; the reference side is precomputed
+    start = time.perf_counter()
+    ref = load_reference_features(admin_image_path)
+    timings['reference'] = time.perf_counter() - start
+    if isinstance(user_image, np.ndarray):
+        img2 = user_image
+    else:
+        start = time.perf_counter()
+        img2 = load_image(user_image)
+        timings['decode'] = time.perf_counter() - start
+    return score_features(ref, img2, threshold, cascade, timings=timings)
+
+
+def score_features(ref, img2, threshold=None, cascade=SIMILARITY_CASCADE, steps=PREPROCESS,
+                   timings=None):
+    """
+    The scoring part of score_similarity(), given reference features from
+    extract_features() (preprocessed with the same `steps`) and a decoded
+    proof array.
+    """
+    timings = {} if timings is None else timings
+    
+    # Resize to the reference's working size for comparison
+    start = time.perf_counter()
+    height, width = ref['gray'].shape
+    img2 = cv2.resize(img2, (width, height), interpolation=cv2.INTER_AREA)
+    timings['resize'] = time.perf_counter() - start
+    img2 = preprocess(img2, steps, timings)
+    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    
+    metrics = {
+        'hash': lambda: max(0, (64 - int(np.count_nonzero(ref['ahash'] != _average_hash(gray2)))) / 64),
+        'histogram': lambda: cv2.compareHist(ref['hist'], _histogram(img2), cv2.HISTCMP_CORREL),
+        'features': lambda: _orb_similarity(ref['orb'], _orb_descriptors(gray2)),
+        'ssim': lambda: ssim(ref['gray'], gray2),
+    }
+    
+    values, total, bound = {}, 0.0, None
+    for i, (name, weight, _, _) in enumerate(SCORING_STAGES):
+        if cascade and threshold is not None and values:
+            rest = SCORING_STAGES[i:]
+            lower = total + sum(w * low for _, w, low, _ in rest)
+            upper = total + sum(w * high for _, w, _, high in rest)
+            if lower >= threshold or upper < threshold:
+                total, bound = (lower, 'lower') if lower >= threshold else (upper, 'upper')
+                break
+        start = time.perf_counter()
+        values[name] = float(metrics[name]())
+        timings[name] = time.perf_counter() - start
+        total += weight * values[name]
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        breakdown = ', '.join(f'{name}={value:.3f}' for name, value in values.items())
+        logger.debug('Similarity breakdown: %s, %s=%.3f', breakdown, bound or 'Final', total)
+    
+    return {'score': max(0.0, min(1.0, total)), 'stages': list(values), 'exact': bound is None,
+            'bound': bound, 'timings': timings}
+
+
+def calculate_similarity_score(admin_image_path, user_image_path):
+    """
+    Enhanced similarity calculation with multiple methods for higher accuracy
+    Returns score between 0.0 and 1.0 (higher = more similar)
+    """
+    return score_similarity(admin_image_path, user_image_path)['score']
+
+
+AGGREGATES = {
+    'max': max,
+    'mean': lambda scores: sum(scores) / len(scores),
+}
+
+
+def _score_image(admin_image_path, user_image_path, threshold):
+    """Decode one proof once, for both its perceptual hash and its similarity."""
+    start = time.perf_counter()
+    try:
+        img = load_image(user_image_path)
+    except Exception as e:
+        logger.error('Cannot read proof image %s: %s', user_image_path, e)
+        return {'score': 0.0 if admin_image_path else None, 'stages': [], 'exact': False,
+                'bound': None, 'phash': None, 'timings': {}}
+    decoded = time.perf_counter()
+    if admin_image_path:
+        result = score_similarity(admin_image_path, img, threshold)
+    else:
+        result = {'score': None, 'stages': [], 'exact': False, 'bound': None, 'timings': {}}
+    hashed = time.perf_counter()
+    result['phash'] = perceptual_hash(img)
+    result['timings'].update(decode=decoded - start, phash=time.perf_counter() - hashed)
+    return result
+
+
+def score_submission(admin_image_path, user_image_paths, threshold=None,
+                     aggregate=SIMILARITY_AGGREGATE):
+    """
+    Score every proof image of a submission concurrently and aggregate them.
+
+    Returns {'score', 'bound', 'images': [per-image result, in upload
+    order]}; 'bound' is as in score_similarity(), and each image also
+    carries its 'phash'. OpenCV releases the GIL, so threads
+    sharing the cached reference features score several images in about
+    the time of one. The cascade only applies to 'max' (one passing image
+    decides it); 'mean' needs every exact score. Without a reference image
+    only the hashes are computed and 'score' is None; an unreadable one raises.
+    """
+    combine = AGGREGATES[aggregate]
+    if aggregate != 'max':
+        threshold = None
+    if admin_image_path:
+        load_reference_features(admin_image_path)  # warm the cache once, not per thread
+    with ThreadPoolExecutor(max_workers=len(user_image_paths)) as pool:
+        images = list(pool.map(lambda path: _score_image(admin_image_path, path, threshold),
+                               user_image_paths))
+    if not admin_image_path:
+        return {'score': None, 'bound': None, 'images': images}
+    score, bound = _aggregate(images, combine)
+    return {'score': score, 'bound': bound, 'images': images}
+
+
+def _aggregate(images, combine):
+    """(score, bound) of a submission from its images' scores and bounds."""
+    if all(image['bound'] is None for image in images):
+        return combine([image['score'] for image in images]), None
+    # Only 'max' cascades: one passing image passes the submission, at least
+    # at the best value known; otherwise the highest value caps it, and is the
+    # exact maximum when a fully scored image reached it.
+    if any(image['bound'] == 'lower' for image in images):
+        return max(image['score'] for image in images if image['bound'] != 'upper'), 'lower'
+    top = max(image['score'] for image in images)
+    exact = any(image['bound'] is None and image['score'] == top for image in images)
+    return top, None if exact else 'upper'
@@ -0,0 +1,1116 @@
+"""
+Storage backends for tasks and submissions.
+
+Two interchangeable backends expose the same small API used by app.py:
+
+* ExcelStorage  - the original layout, two .xlsx workbooks (default).
+* SQLiteStorage - one SQLite database in WAL mode with primary-key and
+                  task_id/status indexes, so reads and single-row updates
+                  no longer cost a full workbook parse and rewrite.
+
+Rows are plain dicts keyed by column name in both backends. ExcelStorage
+keeps each parsed workbook in memory with id/status/task_id indexes and
+re-parses it only after a local write or when the file's mtime/size
+changes (i.e. another gunicorn worker wrote it). Submission writes can go
+through an append-only journal (see journal.py) that is periodically
+compacted back into the workbook.
+
+Every write goes through a transaction:
+
+    with storage.transaction() as tx:
+        tx.update_submission(sid, {'status': 'approved'})
+        tx.update_task(task_id, {'status': 'completed'})
+
+Excel transactions hold cross-process file locks on the workbooks they
+touch, apply all mutations in memory, verify the workbook was not changed
+behind the lock's back (optimistic version check) and write each workbook
+once. SQLite transactions are BEGIN IMMEDIATE ... COMMIT.
+
+Both backends also keep counters (tasks and submissions per status, per
+task, auto-approvals) that every mutation adjusts inside its transaction,
+so the dashboard reads a few numbers instead of scanning tables. SQLite
+keeps them in a `stats` table; ExcelStorage in a JSON sidecar file with its
+own lock. rebuild_stats() recomputes them from the rows.
+
+The admin listing reads one page at a time through query_submissions(),
+which filters, sorts and continues after a keyset cursor (the sort key of
+the last row seen) so a page costs the same however deep it is. The Excel
+backend walks a sorted (submitted_at, id) index from the cursor with bisect;
+only the similarity sort (and a task or status filter matching few rows)
+scans the matching rows for the page.
+
+tasks_version() tells page caches whether the tasks changed: the tasks
+workbook's stat signature, or a `versions` row that SQLite task writes bump
+in the same transaction. Either way every worker sees it.
+"""
+import bisect
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from openpyxl import Workbook, load_workbook
+
+import metrics
+from journal import SubmissionJournal
+from locks import FileLock, per_process_thread
+
+logger = logging.getLogger(__name__)
+
+TASK_COLUMNS = ['id', 'title', 'description', 'reference_image',
+                'created_at', 'status']
+
+SUBMISSION_COLUMNS = ['id', 'task_id', 'user_name', 'user_email', 'mobile_number',
+                      'proof_image', 'submitted_at', 'status', 'admin_notes',
+                      'account_holder_name', 'bank_account_number', 'bank_name',
+                      'ifsc_code', 'branch_name', 'confirmation_mobile',
+                      'similarity_score', 'image_scores', 'scoring_status', 'scoring_stages',
+                      'duplicate_of', 'similarity_bound']
+
+TABLES = {'tasks': TASK_COLUMNS, 'submissions': SUBMISSION_COLUMNS}
+
+
+# query_submissions() sort orders
+SUBMISSION_SORTS = ('submitted_at', 'similarity')
+
+
+# Notes written by the auto-approver start with this
+AUTO_APPROVED_PREFIX = 'Auto-approved'
+# Columns the counters depend on; other updates leave them alone
+STAT_COLUMNS = {'status', 'task_id', 'admin_notes'}
+
+
+class StorageConflict(Exception):
+    """A workbook changed underneath a transaction; the transaction was discarded."""
+
+
+class _BaseStorage:
+    """Single-operation helpers, each run as a one-mutation transaction."""
+
+    conflict_retries = 3
+
+    def _run(self, tables, fn):
+        for attempt in range(self.conflict_retries):
+            try:
+                with self.transaction(tables) as tx:
+                    return fn(tx)
+            except StorageConflict:
+                if attempt == self.conflict_retries - 1:
+                    raise
+
+    def add_task(self, row):
+        self._run(('tasks',), lambda tx: tx.add_task(row))
+
+    def update_task(self, task_id, fields):
+        return self._run(('tasks',), lambda tx: tx.update_task(task_id, fields))
+
+    def delete_task(self, task_id):
+        return self._run(('tasks',), lambda tx: tx.delete_task(task_id))
+
+    def add_submission(self, row):
+        self._run(('submissions',), lambda tx: tx.add_submission(row))
+
+    def update_submission(self, submission_id, fields):
+        return self._run(('submissions',), lambda tx: tx.update_submission(submission_id, fields))
+
+    def update_submissions(self, submission_ids, fields, if_status=None):
+        """
+        Apply the same fields to many submissions in one transaction. With
+        if_status, rows whose status differs (e.g. decided meanwhile) are left
+        alone. Returns (updated rows, {skipped id: its status, None if gone}).
+        """
+        def update(tx):
+            updated, skipped = [], {}
+            for submission_id in submission_ids:
+                current = tx.get_submission(submission_id)
+                if current is None or (if_status is not None and current['status'] != if_status):
+                    skipped[submission_id] = current and current['status']
+                    continue
+                updated.append(tx.update_submission(submission_id, fields))
+            return updated, skipped
+        return self._run(('submissions',), update)
+
+    def delete_submissions(self, task_id):
+        return self._run(('submissions',), lambda tx: tx.delete_submissions(task_id))
+
+    def close(self):
+        """Release per-process resources (before a fork)."""
+
+    def iter_submissions(self, batch_size=500, **query):
+        """Every submission matching a query_submissions() query, one page at a time."""
+        after = None
+        while True:
+            page, after = self.query_submissions(limit=batch_size, after=after, **query)
+            yield from page
+            if after is None:
+                return
+
+
+# ─────────────────────────── Statistics ──────────────────────────────
+def _stat_keys(table, row):
+    """Counters one row adds 1 to, e.g. 'submissions:pending' or 'task:<id>:approved'."""
+    status = str(row.get('status') or '')
+    if table == 'tasks':
+        return ['tasks', f'tasks:{status}']
+    task = f'task:{row.get("task_id")}'
+    keys = ['submissions', f'submissions:{status}', f'{task}:submissions', f'{task}:{status}']
+    if status == 'approved' and str(row.get('admin_notes') or '').startswith(AUTO_APPROVED_PREFIX):
+        keys += ['submissions:auto_approved', f'{task}:auto_approved']
+    return keys
+
+
+def stat_deltas(table, old_rows=(), new_rows=(), deltas=None):
+    """Counter changes for replacing old_rows by new_rows in `table`, added to `deltas`."""
+    deltas = Counter() if deltas is None else deltas
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        for row in rows:
+            for key in _stat_keys(table, row):
+                deltas[key] += sign
+    return deltas
+
+
+def compute_stats(tasks, submissions):
+    """Counters recomputed from every row."""
+    deltas = stat_deltas('tasks', new_rows=tasks)
+    stat_deltas('submissions', new_rows=submissions, deltas=deltas)
+    return {key: value for key, value in deltas.items() if value}
+
+
+def _stats_drift(stored, actual):
+    """{key: (stored, actual)} for every counter that differs."""
+    return {key: (stored.get(key, 0), actual.get(key, 0))
+            for key in sorted(set(stored) | set(actual)) if stored.get(key, 0) != actual.get(key, 0)}
+
+
+class _StatsFile:
+    """Counters in a JSON file, read-modify-written under its own file lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path)
+
+    def read(self):
+        """The counters, or None if the file was never built."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write(self, counters):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(counters, f, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def apply(self, deltas):
+        if not any(deltas.values()):
+            return
+        with self.lock:
+            counters = self.read()
+            if counters is None:
+                return  # built from the tables on first read, which include this change
+            for key, delta in deltas.items():
+                value = counters.get(key, 0) + delta
+                if value:
+                    counters[key] = value
+                else:
+                    counters.pop(key, None)
+            self.write(counters)
+
+
+# ─────────────────────────── Excel backend ───────────────────────────
+def _file_signature(path):
+    # The inode catches an atomic replace of the same size within one mtime tick
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _time_key(row):
+    """A row's place in the by_time index; the same order as _sort_key('submitted_at')."""
+    return (str(row.get('submitted_at') or ''), str(row['id']))
+
+
+class _Table:
+    """
+    Rows of one table in insertion order, indexed by id, status and task_id.
+    Rows with a submitted_at column are also kept in `by_time`, a sorted list
+    of (submitted_at, id) keys that query pages walk with bisect.
+    """
+
+    def __init__(self, rows=()):
+        self.by_id = {}
+        self.by_status = defaultdict(dict)
+        self.by_task = defaultdict(dict)
+        self.by_time = []
+        for row in rows:
+            self.by_id[str(row['id'])] = row
+            self._index(row, timed=False)
+        self.by_time = sorted(_time_key(row) for row in self.by_id.values() if 'submitted_at' in row)
+
+    @property
+    def rows(self):
+        return self.by_id.values()
+
+    def _index(self, row, timed=True):
+        row_id = str(row['id'])
+        self.by_status[row.get('status')][row_id] = row
+        if 'task_id' in row:
+            self.by_task[str(row['task_id'])][row_id] = row
+        if timed and 'submitted_at' in row:
+            bisect.insort(self.by_time, _time_key(row))
+
+    def _unindex(self, row, timed=True):
+        row_id = str(row['id'])
+        self.by_status[row.get('status')].pop(row_id, None)
+        if 'task_id' in row:
+            self.by_task[str(row['task_id'])].pop(row_id, None)
+        if timed and 'submitted_at' in row:
+            key = _time_key(row)
+            i = bisect.bisect_left(self.by_time, key)
+            if i < len(self.by_time) and self.by_time[i] == key:
+                del self.by_time[i]
+
+    def add(self, row):
+        old = self.by_id.get(str(row['id']))
+        if old is not None:
+            self._unindex(old)
+        self.by_id[str(row['id'])] = row
+        self._index(row)
+        return row
+
+    def update(self, row_id, fields):
+        row = self.by_id.get(str(row_id))
+        if row is not None:
+            moved = 'submitted_at' in fields or 'id' in fields
+            self._unindex(row, timed=moved)
+            row.update(fields)
+            self._index(row, timed=moved)
+        return row
+
+    def remove_where(self, column, value):
+        if column == 'task_id':
+            matches = list(self.by_task.get(str(value), {}).values())
+        elif column == 'id':
+            matches = [self.by_id[str(value)]] if str(value) in self.by_id else []
+        else:
+            matches = [r for r in self.by_id.values() if str(r.get(column)) == str(value)]
+        for row in matches:
+            self._unindex(row)
+            del self.by_id[str(row['id'])]
+        return matches
+
+    def apply(self, record):
+        """Apply one mutation record (the journal format) and return its result."""
+        op = record['op']
+        if op == 'add':
+            return self.add(dict(record['row']))
+        if op == 'update':
+            return self.update(record['id'], record['fields'])
+        if op == 'delete':
+            return self.remove_where(record['column'], record['value'])
+        raise ValueError(f'Unknown mutation {op!r}')
+
+
+class _CacheEntry:
+    def __init__(self, signature, table):
+        self.signature = signature
+        self.table = table
+        self.journal_signature = None
+        self.journal_offset = 0
+
+
+def _journal_grew(old, new):
+    """True if the journal only had records appended since `old` was taken."""
+    if new is None:
+        return old is None
+    return old is None or (old[0] == new[0] and new[1] >= old[1])
+
+
+def _score(row):
+    """
+    A row's similarity score as a float (the bound, '>=0.5500' -> 0.55, when
+    the cascade stopped early), or None while unscored.
+    """
+    try:
+        return float(row.get('similarity_score'))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(str(row.get('similarity_bound') or '')[2:])
+    except ValueError:
+        return None
+
+
+def _sort_key(sort):
+    """Python key matching SQLiteStorage's order: unscored rows sort above every score."""
+    if sort == 'submitted_at':
+        return lambda row: (str(row.get('submitted_at') or ''), str(row['id']))
+    if sort == 'similarity':
+        def key(row):
+            score = _score(row)
+            return (0, score, str(row['id'])) if score is not None else (1, 0.0, str(row['id']))
+        return key
+    raise ValueError(f'Unknown sort {sort!r} (expected one of {", ".join(SUBMISSION_SORTS)})')
+
+
+class _ExcelTransaction:
+    """Mutations applied to the cached tables, written back once on commit."""
+
+    def __init__(self, storage, tables):
+        self.storage = storage
+        self.tables = tables
+        self.entries = {}  # table name -> _CacheEntry the mutations were applied to
+        self.dirty = set()
+        self.records = []  # journal records, when submissions are journaled
+        self.stats = Counter()
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise ValueError(f'{name} is not part of this transaction')
+        path = self.storage.paths[name]
+        table = self.storage._table(path)
+        entry = self.storage._cache[path]
+        if self.entries.setdefault(name, entry) is not entry:
+            raise StorageConflict(f'{path} was modified outside the storage lock')
+        return table
+
+    def _mutate(self, name, record):
+        table = self._table(name)
+        row_id = str(record['row']['id'] if record['op'] == 'add' else record.get('id'))
+        old = [dict(table.by_id[row_id])] if record['op'] != 'delete' and row_id in table.by_id else []
+        result = table.apply(record)
+        if record['op'] == 'delete':
+            stat_deltas(name, old_rows=result, deltas=self.stats)
+        else:
+            stat_deltas(name, old, [result], deltas=self.stats)
+        self.dirty.add(name)
+        if name == 'submissions' and self.storage.journal:
+            self.records.append(record)
+        return result
+
+    # reads see this transaction's own writes
+    def get_task(self, task_id):
+        task = self._table('tasks').by_id.get(str(task_id))
+        return dict(task) if task else None
+
+    def get_submission(self, submission_id):
+        submission = self._table('submissions').by_id.get(str(submission_id))
+        return dict(submission) if submission else None
+
+    def add_task(self, row):
+        self._mutate('tasks', {'op': 'add', 'row': dict(row)})
+
+    def update_task(self, task_id, fields):
+        if str(task_id) not in self._table('tasks').by_id:
+            return None
+        return dict(self._mutate('tasks', {'op': 'update', 'id': str(task_id),
+                                           'fields': dict(fields)}))
+
+    def delete_task(self, task_id):
+        removed = self._mutate('tasks', {'op': 'delete', 'column': 'id', 'value': str(task_id)})
+        return removed[0] if removed else None
+
+    def add_submission(self, row):
+        self._mutate('submissions', {'op': 'add', 'row': dict(row)})
+
+    def update_submission(self, submission_id, fields):
+        if str(submission_id) not in self._table('submissions').by_id:
+            return None
+        return dict(self._mutate('submissions', {'op': 'update', 'id': str(submission_id),
+                                                 'fields': dict(fields)}))
+
+    def delete_submissions(self, task_id):
+        if not self._table('submissions').by_task.get(str(task_id)):
+            return []
+        return self._mutate('submissions', {'op': 'delete', 'column': 'task_id',
+                                             'value': str(task_id)})
+
+    def commit(self):
+        st = self.storage
+        for name in sorted(self.dirty):
+            if name == 'submissions' and st.journal:
+                continue
+            path = st.paths[name]
+            entry = self.entries[name]
+            if _file_signature(path) != entry.signature:
+                raise StorageConflict(f'{path} was modified outside the storage lock')
+            st._write_rows(path, st.TITLES[name], TABLES[name], list(entry.table.rows))
+            entry.signature = _file_signature(path)
+        if self.records:
+            st._journal_append(*self.records)
+        if st.stats_file:
+            st.stats_file.apply(self.stats)
+
+
+class ExcelStorage(_BaseStorage):
+    """
+    Tasks and submissions stored in two workbooks, addressed by header name.
+
+    With a journal_path, submission mutations are appended to a
+    SubmissionJournal instead of rewriting submissions.xlsx, and readers
+    see the workbook snapshot with the journal replayed on top.
+    """
+
+    TITLES = {'tasks': 'Tasks', 'submissions': 'Submissions'}
+
+    def __init__(self, tasks_path, submissions_path, journal_path=None, compact_interval=30,
+                 stats_path=None):
+        self.tasks_path = tasks_path
+        self.submissions_path = submissions_path
+        self.paths = {'tasks': tasks_path, 'submissions': submissions_path}
+        self.locks = {name: FileLock(path) for name, path in self.paths.items()}
+        self.journal = SubmissionJournal(journal_path) if journal_path else None
+        self.compact_interval = compact_interval  # seconds; 0 disables the compactor thread
+        self.stats_file = _StatsFile(stats_path) if stats_path else None  # None: count on demand
+        self._cache = {}  # path -> _CacheEntry
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._ensure_compactor = per_process_thread('journal-compactor', self._compactor_loop)
+
+    def init(self):
+        """Create blank workbooks on first run. Returns True if any was created."""
+        created = False
+        for name, path in self.paths.items():
+            with self.locks[name]:
+                if not os.path.exists(path):
+                    self._write_rows(path, self.TITLES[name], TABLES[name], [])
+                    created = True
+        return created
+
+    # -- cache -------------------------------------------------------------
+    def _table(self, path):
+        """
+        Parsed workbook (plus replayed journal), re-read only when the file
+        changed. Callers hold self._lock while they use the returned table.
+        """
+        journal = self.journal if path == self.submissions_path else None
+        signature = _file_signature(path)
+        journal_signature = journal.signature() if journal else None
+        entry = self._cache.get(path)
+        if (entry and entry.signature == signature
+                and entry.journal_signature == journal_signature):
+            return entry.table
+        if (entry is None or entry.signature != signature
+                or not _journal_grew(entry.journal_signature, journal_signature)):
+            entry = _CacheEntry(signature, _Table(self._read_rows(path)))
+        if journal:
+            records, entry.journal_offset = journal.read(entry.journal_offset)
+            for record in records:
+                entry.table.apply(record)
+            entry.journal_signature = journal_signature
+        self._cache[path] = entry
+        return entry.table
+
+    def _invalidate(self, path):
+        self._cache.pop(path, None)
+
+    # -- workbook I/O ------------------------------------------------------
+    @staticmethod
+    def _read_rows(path):
+        with metrics.timed('microtasks_storage_workbook_load_seconds', workbook=os.path.basename(path)):
+            wb = load_workbook(path, read_only=True)
+            try:
+                rows = wb.active.iter_rows(values_only=True)
+                headers = list(next(rows, ()))
+                return [dict(zip(headers, row)) for row in rows if row and row[0]]
+            finally:
+                wb.close()
+
+    @staticmethod
+    def _write_rows(path, title, columns, rows):
+        """Rewrite a whole workbook in one streaming pass, replacing it atomically."""
+        with metrics.timed('microtasks_storage_workbook_save_seconds', workbook=os.path.basename(path)):
+            headers = list(columns)
+            for row in rows:
+                headers.extend(k for k in row if k not in headers)
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet(title)
+            ws.append(headers)
+            for row in rows:
+                ws.append([row.get(h) for h in headers])
+            tmp = path + '.tmp'
+            wb.save(tmp)
+            os.replace(tmp, path)
+
+    # -- transactions ------------------------------------------------------
+    @contextmanager
+    def transaction(self, tables=('tasks', 'submissions')):
+        """
+        Lock the given workbooks (always in the same order), apply every
+        mutation made through the yielded object, and write each touched
+        workbook once. Nested calls join the outer transaction.
+        """
+        current = getattr(self._local, 'tx', None)
+        if current is not None:
+            missing = set(tables) - set(current.tables)
+            if missing:
+                raise ValueError(f'Nested transaction needs {sorted(missing)} locked by the outer one')
+            yield current
+            return
+        names = [name for name in TABLES if name in tables]
+        for name in names:
+            self.locks[name].acquire()
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                tx = self._local.tx = _ExcelTransaction(self, names)
+                try:
+                    yield tx
+                    tx.commit()
+                except BaseException:
+                    # the cached tables may hold uncommitted mutations
+                    for name in tx.dirty:
+                        self._invalidate(self.paths[name])
+                    raise
+                finally:
+                    self._local.tx = None
+        finally:
+            for name in reversed(names):
+                self.locks[name].release()
+            metrics.observe('microtasks_storage_transaction_seconds', time.perf_counter() - start,
+                            backend='excel')
+
+    def add_submission(self, row):
+        # A journaled insert is a pure append: skip the workbook lock so
+        # concurrent uploads keep group-committing together.
+        if self.journal:
+            self._journal_append({'op': 'add', 'row': dict(row)})
+            if self.stats_file:
+                self.stats_file.apply(stat_deltas('submissions', new_rows=[row]))
+        else:
+            super().add_submission(row)
+
+    # -- reads -------------------------------------------------------------
+    # Readers get copies so callers can decorate rows without touching the cache.
+    def get_tasks(self):
+        with self._lock:
+            return [dict(t) for t in self._table(self.tasks_path).rows]
+
+    def get_task(self, task_id):
+        with self._lock:
+            task = self._table(self.tasks_path).by_id.get(str(task_id))
+            return dict(task) if task else None
+
+    def count_tasks(self, status=None):
+        with self._lock:
+            table = self._table(self.tasks_path)
+            return len(table.by_id if status is None else table.by_status.get(status, ()))
+
+    def get_submissions(self, task_id=None, status=None):
+        with self._lock:
+            table = self._table(self.submissions_path)
+            if task_id is not None:
+                rows = table.by_task.get(str(task_id), {}).values()
+                if status is not None:
+                    rows = [s for s in rows if s.get('status') == status]
+            elif status is not None:
+                rows = table.by_status.get(status, {}).values()
+            else:
+                rows = table.rows
+            return [dict(s) for s in rows]
+
+    def get_submission(self, submission_id):
+        with self._lock:
+            submission = self._table(self.submissions_path).by_id.get(str(submission_id))
+            return dict(submission) if submission else None
+
+    def _matching_submissions(self, status=None, task_id=None, submitted_from=None, submitted_before=None,
+                              min_score=None, max_score=None):
+        """Cached rows passing the filters; callers hold self._lock."""
+        table = self._table(self.submissions_path)
+        if task_id is not None:
+            rows = table.by_task.get(str(task_id), {}).values()
+        elif status is not None:
+            rows = table.by_status.get(status, {}).values()
+        else:
+            rows = table.rows
+        for row in rows:
+            submitted = str(row.get('submitted_at') or '')
+            if (submitted_from and submitted < submitted_from
+                    or submitted_before and submitted >= submitted_before):
+                continue
+            if self._passes(row, status=status, min_score=min_score, max_score=max_score):
+                yield row
+
+    def _narrow(self, filters, limit):
+        """
+        True if a task/status filter leaves so few rows that scanning them beats
+        walking by_time: a walk passes about (limit * all / matching) keys.
+        """
+        table = self._table(self.submissions_path)
+        if filters.get('task_id') is not None:
+            subset = len(table.by_task.get(str(filters['task_id']), ()))
+        elif filters.get('status') is not None:
+            subset = len(table.by_status.get(filters['status'], ()))
+        else:
+            return False
+        return subset * subset < (limit + 1) * len(table.by_time)
+
+    def _walk_by_time(self, descending, count, after=None, submitted_from=None, submitted_before=None,
+                      **filters):
+        """Up to `count` rows past the cursor in submitted_at order; callers hold self._lock."""
+        table = self._table(self.submissions_path)
+        keys = table.by_time
+        lo = bisect.bisect_left(keys, (submitted_from,)) if submitted_from else 0
+        hi = bisect.bisect_left(keys, (submitted_before,)) if submitted_before else len(keys)
+        if after is not None:
+            if descending:
+                hi = min(hi, bisect.bisect_left(keys, after))
+            else:
+                lo = max(lo, bisect.bisect_right(keys, after))
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        found = []
+        for i in positions:
+            row = table.by_id[keys[i][1]]
+            if self._passes(row, **filters):
+                found.append(row)
+                if len(found) == count:
+                    break
+        return found
+
+    @staticmethod
+    def _passes(row, status=None, task_id=None, min_score=None, max_score=None):
+        if status is not None and row.get('status') != status:
+            return False
+        if task_id is not None and str(row.get('task_id')) != str(task_id):
+            return False
+        if min_score is not None or max_score is not None:
+            score = _score(row)
+            if (score is None or min_score is not None and score < min_score
+                    or max_score is not None and score > max_score):
+                return False
+        return True
+
+    def query_submissions(self, sort='submitted_at', descending=True, limit=50, after=None, **filters):
+        """
+        One page of submissions and the cursor for the next (None on the last
+        page). Filters: status, task_id, submitted_from / submitted_before
+        ('YYYY-MM-DD ...' strings, the latter exclusive) and min_score /
+        max_score (a score band leaves out unscored rows; a cascade bound
+        filters and sorts as its value).
+        """
+        key = _sort_key(sort)
+        after = tuple(after) if after is not None else None
+        with self._lock:
+            if sort == 'submitted_at' and not self._narrow(filters, limit):
+                page = [dict(row) for row in self._walk_by_time(descending, limit + 1, after, **filters)]
+            else:
+                matches = self._matching_submissions(**filters)
+                if after is not None:
+                    matches = (row for row in matches if (key(row) < after if descending else key(row) > after))
+                pick = heapq.nlargest if descending else heapq.nsmallest
+                page = [dict(row) for row in pick(limit + 1, matches, key=key)]
+        if len(page) <= limit:
+            return page, None
+        page = page[:limit]
+        return page, list(key(page[-1]))
+
+    def count_submissions(self, status=None):
+        with self._lock:
+            table = self._table(self.submissions_path)
+            return len(table.by_id if status is None else table.by_status.get(status, ()))
+
+    def iter_submissions(self, sort='submitted_at', descending=True, batch_size=500, **filters):
+        """Every matching submission in order; sorted once, copied a batch at a time."""
+        key = _sort_key(sort)
+        with self._lock:
+            rows = sorted(self._matching_submissions(**filters), key=key, reverse=descending)
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = [dict(row) for row in rows[start:start + batch_size]]
+            yield from batch
+
+    def tasks_version(self):
+        """(token that changes with every task write, time of the last one) for page caches."""
+        st = os.stat(self.tasks_path)  # every task write replaces the workbook
+        return (st.st_mtime_ns, st.st_size, st.st_ino), st.st_mtime
+
+    # -- statistics --------------------------------------------------------
+    def _compute_stats(self):
+        with self._lock:
+            return compute_stats(self._table(self.tasks_path).rows,
+                                 self._table(self.submissions_path).rows)
+
+    def stats(self):
+        """Dashboard counters; the sidecar is built from the workbooks on first use."""
+        if not self.stats_file:
+            return self._compute_stats()
+        counters = self.stats_file.read()
+        return counters if counters is not None else self.rebuild_stats()
+
+    def rebuild_stats(self):
+        """Recompute the counters from every row and store them."""
+        with self.transaction():
+            counters = self._compute_stats()
+            if self.stats_file:
+                with self.stats_file.lock:
+                    self.stats_file.write(counters)
+        return counters
+
+    def verify_stats(self):
+        """{key: (stored, actual)} for every counter that drifted from the rows."""
+        with self.transaction():
+            return _stats_drift(self.stats(), self._compute_stats())
+
+    # -- journal compaction ------------------------------------------------
+    def _journal_append(self, *records):
+        self.journal.append(*records)
+        if self.compact_interval:
+            self._ensure_compactor()  # in each process that writes
+
+    def _compactor_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('Error compacting submission journal')
+
+    def compact(self):
+        """
+        Fold the journal into submissions.xlsx. Only one process compacts at
+        a time; returns the number of records folded (0 if skipped).
+        """
+        if not self.journal:
+            return 0
+        workbook_lock = self.locks['submissions']
+        if not workbook_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self.journal.lock:
+                records, offset = self.journal.read(0)
+            if not offset:  # (lines that did not parse are dropped with the rest)
+                return 0
+            table = _Table(self._read_rows(self.submissions_path))
+            for record in records:
+                table.apply(record)
+            self._write_rows(self.submissions_path, 'Submissions', SUBMISSION_COLUMNS,
+                             list(table.rows))
+            # Readers that see the new workbook with the old journal replay
+            # records that are already folded in; every op is idempotent.
+            with self.journal.lock:
+                self.journal.truncate_prefix(offset)
+            return len(records)
+        finally:
+            workbook_lock.release()
+
+
+# ─────────────────────────── SQLite backend ──────────────────────────
+class _SQLiteTransaction:
+    """Mutations executed on the connection of an open BEGIN IMMEDIATE."""
+
+    def __init__(self, storage, tables):
+        self.storage = storage
+        self.tables = tables
+
+    def get_task(self, task_id):
+        return self.storage.get_task(task_id)
+
+    def get_submission(self, submission_id):
+        return self.storage.get_submission(submission_id)
+
+    def add_task(self, row):
+        self.storage._insert('tasks', row)
+
+    def update_task(self, task_id, fields):
+        return self.storage._update('tasks', task_id, fields)
+
+    def delete_task(self, task_id):
+        return (self.storage._delete('tasks', 'id', task_id) or [None])[0]
+
+    def add_submission(self, row):
+        self.storage._insert('submissions', row)
+
+    def update_submission(self, submission_id, fields):
+        return self.storage._update('submissions', submission_id, fields)
+
+    def delete_submissions(self, task_id):
+        return self.storage._delete('submissions', 'task_id', task_id)
+
+
+# _score() in SQL: the exact score, else the number in similarity_bound, else ''
+_SCORE_SQL = ("COALESCE(NULLIF(similarity_score, ''), "
+              "CAST(SUBSTR(NULLIF(similarity_bound, ''), 3) AS REAL), '')")
+
+
+class SQLiteStorage(_BaseStorage):
+    """Tasks and submissions in one SQLite database (WAL mode, indexed)."""
+
+    TABLES = TABLES
+    INDEXES = [('idx_tasks_status', 'tasks', 'status'),
+               ('idx_submissions_task_id', 'submissions', 'task_id'),
+               ('idx_submissions_status', 'submissions', 'status'),
+               # query_submissions(): one index per sort order and per filter + date order
+               ('idx_submissions_submitted', 'submissions', 'submitted_at, id'),
+               ('idx_submissions_status_submitted', 'submissions', 'status, submitted_at, id'),
+               ('idx_submissions_task_submitted', 'submissions', 'task_id, submitted_at, id'),
+               ('idx_submissions_score', 'submissions', f'{_SCORE_SQL}, id')]
+
+    # Unscored rows hold '' (or NULL before the column existed); SQLite sorts
+    # text above every number, so they come after all scores in ascending order.
+    SORT_EXPRESSIONS = {'submitted_at': 'submitted_at',
+                        'similarity': _SCORE_SQL}
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self):
+        """One connection per thread, re-opened after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+            self._local.tx = None
+        return conn
+
+    def close(self):
+        """Close this thread's connection; the next use opens a new one."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init(self):
+        """Create tables and indexes. Returns True if the database file is new."""
+        created = not os.path.exists(self.db_path)
+        with self.transaction():
+            conn = self._conn()
+            for table, columns in self.TABLES.items():
+                cols = ', '.join(f'{c} TEXT PRIMARY KEY' if c == 'id' else c for c in columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({cols})')
+                existing = {r['name'] for r in conn.execute(f'PRAGMA table_info({table})')}
+                for column in columns:
+                    if column not in existing:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+            # Replaced by idx_submissions_score once cascade bounds were sorted too
+            conn.execute('DROP INDEX IF EXISTS idx_submissions_similarity')
+            for name, table, column in self.INDEXES:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}({column})')
+            stats_missing = not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats'").fetchone()
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            if stats_missing:
+                self.rebuild_stats()
+            conn.execute('CREATE TABLE IF NOT EXISTS versions '
+                         '(name TEXT PRIMARY KEY, version INTEGER NOT NULL, changed_at REAL NOT NULL)')
+        return created
+
+    @contextmanager
+    def transaction(self, tables=('tasks', 'submissions')):
+        """BEGIN IMMEDIATE ... COMMIT; nested calls join the outer transaction."""
+        conn = self._conn()
+        if self._local.tx is not None:
+            yield self._local.tx
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        start = time.perf_counter()
+        self._local.tx = _SQLiteTransaction(self, tables)
+        try:
+            yield self._local.tx
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.tx = None
+            metrics.observe('microtasks_storage_transaction_seconds', time.perf_counter() - start,
+                            backend='sqlite')
+
+    # -- low level helpers ------------------------------------------------
+    def _check(self, table, names):
+        unknown = set(names) - set(self.TABLES[table])
+        if unknown:
+            raise KeyError(f'Unknown {table} column(s): {", ".join(sorted(unknown))}')
+
+    def _select(self, table, where='', params=()):
+        sql = f'SELECT * FROM {table} {where} ORDER BY rowid'
+        return [dict(r) for r in self._conn().execute(sql, params)]
+
+    def _insert(self, table, row, replace=False):
+        self._check(table, row)
+        names = list(row)
+        old = self._select(table, 'WHERE id = ?', (str(row['id']),)) if replace else []
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        sql = (f'{verb} INTO {table} ({", ".join(names)}) '
+               f'VALUES ({", ".join("?" * len(names))})')
+        self._conn().execute(sql, [row[n] for n in names])
+        self._apply_stats(stat_deltas(table, old, [row]))
+        self._touch(table)
+
+    def _update(self, table, row_id, fields):
+        self._check(table, fields)
+        conn = self._conn()
+        old = self._select(table, 'WHERE id = ?', (str(row_id),)) if STAT_COLUMNS & set(fields) else None
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        cur = conn.execute(f'UPDATE {table} SET {assignments} WHERE id = ?',
+                           [*fields.values(), str(row_id)])
+        if not cur.rowcount:
+            return None
+        row = dict(conn.execute(f'SELECT * FROM {table} WHERE id = ?', (str(row_id),)).fetchone())
+        if old is not None:
+            self._apply_stats(stat_deltas(table, old, [row]))
+        self._touch(table)
+        return row
+
+    def _delete(self, table, column, value):
+        self._check(table, [column])
+        removed = self._select(table, f'WHERE {column} = ?', (str(value),))
+        self._conn().execute(f'DELETE FROM {table} WHERE {column} = ?', (str(value),))
+        self._apply_stats(stat_deltas(table, old_rows=removed))
+        if removed:
+            self._touch(table)
+        return removed
+
+    def _apply_stats(self, deltas):
+        changed = [(key, delta) for key, delta in deltas.items() if delta]
+        if not changed:
+            return
+        conn = self._conn()
+        conn.executemany('INSERT INTO stats (key, value) VALUES (?, ?) '
+                         'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value', changed)
+        conn.executemany('DELETE FROM stats WHERE key = ? AND value = 0', [(key,) for key, _ in changed])
+
+    def _touch(self, table):
+        # Only tasks are versioned: page caches key on them, submissions change too often
+        if table == 'tasks':
+            self._conn().execute(
+                'INSERT INTO versions (name, version, changed_at) VALUES (?, 1, ?) '
+                'ON CONFLICT(name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at',
+                (table, time.time()))
+
+    def tasks_version(self):
+        """(counter bumped by every task write, time of the last one) for page caches."""
+        row = self._conn().execute("SELECT version, changed_at FROM versions WHERE name = 'tasks'").fetchone()
+        return (row['version'], row['changed_at']) if row else (0, None)
+
+    # -- statistics --------------------------------------------------------
+    def stats(self):
+        """Dashboard counters, maintained by every insert/update/delete."""
+        return {key: value for key, value in self._conn().execute('SELECT key, value FROM stats')}
+
+    def rebuild_stats(self):
+        """Recompute the counters from every row and store them."""
+        with self.transaction():
+            counters = compute_stats(self.get_tasks(), self.get_submissions())
+            conn = self._conn()
+            conn.execute('DELETE FROM stats')
+            conn.executemany('INSERT INTO stats (key, value) VALUES (?, ?)', counters.items())
+        return counters
+
+    def verify_stats(self):
+        """{key: (stored, actual)} for every counter that drifted from the rows."""
+        with self.transaction():
+            return _stats_drift(self.stats(), compute_stats(self.get_tasks(), self.get_submissions()))
+
+    # -- reads -------------------------------------------------------------
+    def get_tasks(self):
+        return self._select('tasks')
+
+    def get_task(self, task_id):
+        rows = self._select('tasks', 'WHERE id = ?', (str(task_id),))
+        return rows[0] if rows else None
+
+    def count_tasks(self, status=None):
+        if status is None:
+            return self._conn().execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM tasks WHERE status = ?',
+                                    (status,)).fetchone()[0]
+
+    def get_submissions(self, task_id=None, status=None):
+        clauses, params = [], []
+        if task_id is not None:
+            clauses.append('task_id = ?')
+            params.append(str(task_id))
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        return self._select('submissions', where, params)
+
+    def get_submission(self, submission_id):
+        rows = self._select('submissions', 'WHERE id = ?', (str(submission_id),))
+        return rows[0] if rows else None
+
+    def query_submissions(self, status=None, task_id=None, submitted_from=None, submitted_before=None,
+                          min_score=None, max_score=None, sort='submitted_at', descending=True,
+                          limit=50, after=None):
+        """One page of submissions and the cursor for the next, read along an index."""
+        if sort not in self.SORT_EXPRESSIONS:
+            raise ValueError(f'Unknown sort {sort!r} (expected one of {", ".join(SUBMISSION_SORTS)})')
+        expression = self.SORT_EXPRESSIONS[sort]
+        score = self.SORT_EXPRESSIONS['similarity']
+        clauses, params = [], []
+        for clause, value in (('status = ?', status),
+                              ('task_id = ?', None if task_id is None else str(task_id)),
+                              ('submitted_at >= ?', submitted_from),
+                              ('submitted_at < ?', submitted_before),
+                              (f'{score} >= ?', min_score), (f'{score} <= ?', max_score)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if min_score is not None or max_score is not None:
+            clauses.append(f"{score} < ''")  # every number is below any text: drops unscored rows
+        if after is not None:
+            clauses.append(f'({expression}, id) {"<" if descending else ">"} (?, ?)')
+            params.extend(after)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        direction = 'DESC' if descending else 'ASC'
+        sql = (f'SELECT *, {expression} AS sort_key FROM submissions {where} '
+               f'ORDER BY {expression} {direction}, id {direction} LIMIT ?')
+        page = [dict(r) for r in self._conn().execute(sql, [*params, limit + 1])]
+        keys = [(row.pop('sort_key'), row['id']) for row in page]
+        if len(page) <= limit:
+            return page, None
+        return page[:limit], list(keys[limit - 1])
+
+    def count_submissions(self, status=None):
+        if status is None:
+            return self._conn().execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM submissions WHERE status = ?',
+                                    (status,)).fetchone()[0]
+
+
+# ─────────────────────────── Factory / import ────────────────────────
+def create_storage(backend, tasks_path, submissions_path, sqlite_path,
+                   journal_path=None, compact_interval=30, stats_path=None):
+    if backend == 'excel':
+        return ExcelStorage(tasks_path, submissions_path, journal_path, compact_interval, stats_path)
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f'Unknown STORAGE_BACKEND {backend!r} (expected "excel" or "sqlite")')
+
+
+def _db_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def import_excel(db, excel):
+    """
+    Copy rows from an ExcelStorage (workbooks plus any unfolded journal)
+    into a SQLiteStorage. Rows are upserted by id, so running the import
+    twice is harmless. Returns (tasks_imported, submissions_imported).
+    """
+    counts = []
+    for table, path, read in (('tasks', excel.tasks_path, excel.get_tasks),
+                              ('submissions', excel.submissions_path, excel.get_submissions)):
+        rows = read() if os.path.exists(path) else []
+        columns = set(db.TABLES[table])
+        with db.transaction():
+            for row in rows:
+                db._insert(table, {k: _db_value(v) for k, v in row.items() if k in columns},
+                           replace=True)
+        counts.append(len(rows))
+    return tuple(counts)
@@ -0,0 +1,163 @@
+"""
+Storage paths where a bug loses data: Excel transactions across processes,
+the submission journal and its compaction, torn writes, and keyset paging.
+"""
+import json
+import multiprocessing
+
+import pytest
+
+from duplicates import DuplicateIndex
+from storage import ExcelStorage, SQLiteStorage, StorageConflict
+
+
+def excel(tmp_path, journal=False):
+    storage = ExcelStorage(str(tmp_path / 'tasks.xlsx'), str(tmp_path / 'submissions.xlsx'),
+                           str(tmp_path / 'journal.jsonl') if journal else None, 0)
+    storage.init()
+    return storage
+
+
+def submission(i, **fields):
+    row = {'id': f's{i:03d}', 'task_id': 't1', 'user_name': f'user {i}', 'status': 'pending',
+           'submitted_at': f'2026-01-01 00:{i // 60:02d}:{i % 60:02d}', 'admin_notes': ''}
+    row.update(fields)
+    return row
+
+
+@pytest.fixture(params=['excel', 'excel+journal', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'sqlite':
+        storage = SQLiteStorage(str(tmp_path / 'microtasks.db'))
+        storage.init()
+        yield storage
+        storage.close()
+    else:
+        yield excel(tmp_path, journal=request.param == 'excel+journal')
+
+
+# ─────────────────────────── Transactions ────────────────────────────
+def _increment(tmp_path, times):
+    storage = excel(tmp_path)
+    for _ in range(times):
+        with storage.transaction(('tasks',)) as tx:
+            count = int(tx.get_task('t1')['description'])
+            tx.update_task('t1', {'description': str(count + 1)})
+
+
+def test_concurrent_transactions_do_not_lose_updates(tmp_path):
+    excel(tmp_path).add_task({'id': 't1', 'title': 'T', 'description': '0', 'status': 'active'})
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_increment, args=(tmp_path, 5)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    assert excel(tmp_path).get_task('t1')['description'] == '20'
+
+
+def test_workbook_replaced_outside_the_lock_discards_the_transaction(tmp_path):
+    storage = excel(tmp_path)
+    storage.add_task({'id': 't1', 'title': 'T', 'status': 'active'})
+    with pytest.raises(StorageConflict):
+        with storage.transaction(('tasks',)) as tx:
+            tx.update_task('t1', {'status': 'completed'})
+            # e.g. someone saving the workbook by hand meanwhile
+            ExcelStorage._write_rows(storage.tasks_path, 'Tasks', ['id', 'title', 'status'],
+                                     [{'id': 't1', 'title': 'edited', 'status': 'active'},
+                                      {'id': 't2', 'title': 'added', 'status': 'active'}])
+    # The outside write survives and the cache does not keep the lost mutation
+    assert {t['id']: (t['title'], t['status']) for t in storage.get_tasks()} == {
+        't1': ('edited', 'active'), 't2': ('added', 'active')}
+
+
+# ─────────────────────────── Journal ─────────────────────────────────
+def test_journal_replay_after_compaction(tmp_path):
+    writer = excel(tmp_path, journal=True)
+    reader = excel(tmp_path, journal=True)  # another worker, with its own cache
+    for i in range(5):
+        writer.add_submission(submission(i))
+    writer.update_submission('s001', {'status': 'approved'})
+    assert len(reader.get_submissions()) == 5  # caches the journal offset
+
+    assert writer.compact() == 6
+    assert (tmp_path / 'journal.jsonl').stat().st_size == 0
+    writer.update_submission('s002', {'status': 'rejected'})
+    writer.add_submission(submission(5))
+
+    for storage in (reader, writer, excel(tmp_path, journal=True)):
+        rows = {s['id']: s['status'] for s in storage.get_submissions()}
+        assert rows == {'s000': 'pending', 's001': 'approved', 's002': 'rejected',
+                        's003': 'pending', 's004': 'pending', 's005': 'pending'}
+
+
+def test_torn_journal_tail_is_dropped_and_appends_continue(tmp_path):
+    storage = excel(tmp_path, journal=True)
+    storage.add_submission(submission(0))
+    journal = tmp_path / 'journal.jsonl'
+    with open(journal, 'ab') as f:
+        f.write(b'{"op": "add", "row": {"id": "s9')  # writer killed mid-line
+
+    assert [s['id'] for s in excel(tmp_path, journal=True).get_submissions()] == ['s000']
+    storage.add_submission(submission(1))
+    lines = journal.read_bytes().splitlines()
+    assert [json.loads(line)['row']['id'] for line in lines] == ['s000', 's001']
+    assert storage.compact() == 2
+    assert sorted(s['id'] for s in excel(tmp_path, journal=True).get_submissions()) == ['s000', 's001']
+
+
+def test_corrupt_journal_line_is_skipped(tmp_path):
+    storage = excel(tmp_path, journal=True)
+    storage.add_submission(submission(0))
+    with open(tmp_path / 'journal.jsonl', 'ab') as f:
+        f.write(b'{"op": "add", "row": {"id": "s9{"op": "add"}\n')  # appended onto a torn line
+    storage.add_submission(submission(1))
+    assert sorted(s['id'] for s in excel(tmp_path, journal=True).get_submissions()) == ['s000', 's001']
+
+
+def test_torn_duplicate_index_tail(tmp_path):
+    path = str(tmp_path / 'hashes.jsonl')
+    DuplicateIndex(path).check_and_add('s1', [('ffffffffffffffff', 'a.png')], 4)
+    with open(path, 'ab') as f:
+        f.write(b'{"hash": "ffff')
+    assert DuplicateIndex(path).check_and_add('s2', [('fffffffffffffffe', 'b.png')], 4) == [(1, 's1', 'a.png')]
+    assert DuplicateIndex(path).check_and_add('s3', [('fffffffffffffffc', 'c.png')], 4) == [
+        (1, 's2', 'b.png'), (2, 's1', 'a.png')]
+
+
+# ─────────────────────────── Paging ──────────────────────────────────
+def _walk(storage, **query):
+    after = None
+    while True:
+        page, after = storage.query_submissions(limit=7, after=after, **query)
+        yield page
+        if after is None:
+            return
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_cursor_pages_stay_stable_while_rows_change(storage, descending):
+    for i in range(50):
+        storage.add_submission(submission(i))
+    seen, added = [], 100
+    for page in _walk(storage, descending=descending):
+        seen.extend(s['id'] for s in page)
+        # Between pages: a newer upload arrives and a listed row is decided
+        storage.add_submission(submission(added, submitted_at=f'2026-02-01 00:00:{added - 100:02d}'))
+        added += 1
+        if page:
+            storage.update_submission(page[0]['id'], {'status': 'approved'})
+    assert len(seen) == len(set(seen))
+    assert {f's{i:03d}' for i in range(50)} <= set(seen)
+
+
+def test_similarity_cursor_covers_every_row_once(storage):
+    for i in range(30):
+        score = '' if i % 5 == 0 else round((i * 37 % 100) / 100, 2)
+        bound = '<=0.3012' if i % 10 == 0 else ''
+        storage.add_submission(submission(i, similarity_score=score, similarity_bound=bound))
+    pages = list(_walk(storage, sort='similarity'))
+    ids = [s['id'] for page in pages for s in page]
+    assert sorted(ids) == [f's{i:03d}' for i in range(30)]
+    assert len(ids) == len(set(ids))
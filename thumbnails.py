@@ -0,0 +1,123 @@
+"""
+On-disk cache of small WebP previews of uploaded images.
+
+A preview is generated the first time it is requested, from a reduced-size
+decode of the original, and kept in the cache directory under a key derived
+from the source path and the preview size. Uploads are content-addressed
+(`<sha256>.<ext>`), so their path alone identifies the content; any other
+file name also keys on its mtime. The key doubles as the ETag, and since a
+given key never changes content the previews can be served as immutable. Hits bump the file's mtime; when the cache grows past
+its byte budget the least recently used previews are evicted.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# uploads.content_path() names: '<sha256 hex>.<ext>'
+_CONTENT_NAME = re.compile(r'[0-9a-f]{64}\.[0-9a-z]+')
+
+
+class ThumbnailCache:
+    """WebP previews of uploaded images, kept in `cache_dir` within a byte budget."""
+
+    def __init__(self, cache_dir, size=320, quality=75, budget_bytes=256 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.size = size
+        self.quality = quality
+        self.budget_bytes = budget_bytes
+        self._bytes = None  # estimated cache size, rescanned when evicting
+        self._guard = threading.Lock()
+
+    def key(self, source_path):
+        """Cache key / ETag for a source image, or None if it does not exist."""
+        try:
+            mtime_ns = os.stat(source_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if _CONTENT_NAME.fullmatch(os.path.basename(source_path)):
+            mtime_ns = ''  # the name is the content's hash
+        raw = f'{os.path.abspath(source_path)}|{mtime_ns}|{self.size}|{self.quality}'
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def get(self, source_path):
+        """(preview path, key) for a source image, generating the preview if needed."""
+        key = self.key(source_path)
+        if key is None:
+            return None, None
+        path = os.path.join(self.cache_dir, key[:2], key + '.webp')
+        try:
+            os.utime(path)  # LRU: mark as recently used
+            return path, key
+        except FileNotFoundError:
+            pass
+        self._generate(source_path, path)
+        return path, key
+
+    def discard(self, source_path):
+        """Remove the preview of a source image (call before removing the source)."""
+        key = self.key(source_path)
+        if key is None:
+            return
+        try:
+            os.remove(os.path.join(self.cache_dir, key[:2], key + '.webp'))
+        except FileNotFoundError:
+            pass
+
+    def _generate(self, source_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with Image.open(source_path) as img:
+            img.draft('RGB', (self.size, self.size))  # JPEG: decode at reduced scale
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            img.thumbnail((self.size, self.size))
+            tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+            img.save(tmp, 'WEBP', quality=self.quality, method=4)
+        os.replace(tmp, path)
+        self._account(os.path.getsize(path))
+
+    # -- eviction ----------------------------------------------------------
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.webp'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _account(self, added):
+        with self._guard:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes += added
+            if self.budget_bytes and self._bytes > self.budget_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used previews down to 90% of the budget."""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.budget_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self._bytes = total
+        logger.info('Evicted %d thumbnails; cache is now %d bytes', evicted, total)
@@ -0,0 +1,168 @@
+"""
+Streaming, size-limited, content-addressed upload storage.
+
+Werkzeug normally spools each uploaded file to a temporary file and the
+route then copies it with file.save(). UploadRequest swaps that spool for a
+HashingSpool in the staging directory: every chunk is size-checked and
+hashed as it arrives, a file over the limit aborts the request with 413 at
+the first chunk past it, and store_upload() then just renames the spool to
+`<folder>/ab/cd/<sha256>.<ext>`. An identical file uploaded again is found
+at that path and the new copy is dropped, so each image is stored once; the
+re-upload is recorded in `<staging>/reused/<sha256>` for stored_at().
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+CHUNK_SIZE = 64 * 1024
+
+# Spellings of one format share a single content address
+_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+
+def format_size(size):
+    """Bytes as '512 KB' / '4.77 MB' for messages (limits under 1 MiB would read as '0 MB')."""
+    if size < 2**20:
+        return f'{round(size / 2**10, 2):g} KB'
+    return f'{round(size / 2**20, 2):g} MB'
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """A single uploaded file is larger than MAX_FILE_SIZE."""
+
+
+class HashingSpool:
+    """Writable/readable temp file that hashes and size-checks what is written."""
+
+    def __init__(self, directory, max_size):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            self.close()
+            raise UploadTooLarge(f'Each image must be at most {format_size(self.max_size)}.')
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def close(self):
+        """Close and remove the spool unless store_upload() already moved it."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class UploadRequest(Request):
+    """Spools file uploads through HashingSpool (see app.request_class)."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool(current_app.config['UPLOAD_STAGING_DIR'], current_app.config['MAX_FILE_SIZE'])
+
+
+def content_path(digest, filename):
+    """Relative content address for a sha256 hex digest: 'ab/cd/<digest>.<ext>'."""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    ext = _EXTENSION_ALIASES.get(ext, ext) if ext.isalnum() else 'bin'
+
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+
+def _reuse_marker(staging, digest):
+    return os.path.join(staging, 'reused', digest)
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+def stored_at(path, staging):
+    """
+    When the upload at `path` was last stored, counting re-uploads of the same
+    content (which reuse the file). FileNotFoundError if it does not exist.
+    """
+    stored = os.path.getmtime(path)
+    digest = os.path.basename(path).split('.')[0]
+    try:
+        return max(stored, os.path.getmtime(_reuse_marker(staging, digest)))
+    except FileNotFoundError:
+        return stored
+
+
+def forget_upload(path, staging):
+    """Drop the re-upload marker of a removed upload."""
+    try:
+        os.remove(_reuse_marker(staging, os.path.basename(path).split('.')[0]))
+    except FileNotFoundError:
+        pass
+
+
+def store_upload(file, folder):
+    """
+    Move an uploaded FileStorage into `folder` under its content address and
+    return that relative path (usable in url_for('static', ...)). A file
+    already stored with the same content is reused.
+    """
+    spool = file.stream
+    if isinstance(spool, HashingSpool):
+        spool.flush()
+        source, digest = spool.path, spool.sha256.hexdigest()
+    else:
+        # Not spooled by UploadRequest (e.g. a small in-memory part): copy it out in chunks
+        digest_obj = hashlib.sha256()
+        staging = current_app.config['UPLOAD_STAGING_DIR']
+        os.makedirs(staging, exist_ok=True)
+        fd, source = tempfile.mkstemp(dir=staging, prefix='.upload-')
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                digest_obj.update(chunk)
+                out.write(chunk)
+        digest = digest_obj.hexdigest()
+
+    relative = content_path(digest, file.filename or '')
+    target = os.path.join(folder, *relative.split('/'))
+    if os.path.exists(target):
+        os.remove(source)
+        # The file itself stays untouched (thumbnail keys and ETags rely on
+        # that); the cleanup grace period sees the re-upload through the marker
+        _touch(_reuse_marker(current_app.config['UPLOAD_STAGING_DIR'], digest))
+        return relative
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+    except OSError:  # staging dir on another filesystem
+        shutil.move(source, target)
+    os.chmod(target, 0o644)  # mkstemp creates 0600 files
+    return relative